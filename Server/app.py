@@ -1,13 +1,27 @@
 # app.py
-from flask import Flask, request, jsonify, render_template
-from sqlalchemy.orm import Session
-from database import SessionLocal
-from initialize_db import init_db
-from models import User, Memory, History
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
+from sqlalchemy.orm import Session, configure_mappers
+from sqlalchemy.exc import OperationalError
+from database import shards, shard_for, shard_index, map_shards
+from initialize_db import init_db, check_schema, SchemaError
+from models import User, Memory, History, ArchivedMemory, ArchivedHistory
 import uuid
-from sqlalchemy import text
+from sqlalchemy import text, tuple_
+from datetime import datetime
 import logging
 import re
+import metrics
+import dedup
+import fts
+import tiering
+import time
+import heapq
+import collections
+import base64
+import json
+import threading
+import zlib
+from changefeed import record_change, record_changes, read_sharded_changes, notifier, MAX_BATCH_SIZE, MAX_WAIT_SECONDS
 
 def calculate_rank(content, query):
     # Extract words from the query
@@ -20,21 +34,86 @@ def calculate_rank(content, query):
 
 app = Flask(__name__)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize the database
-init_db()
-
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
+# Request latency and SQL instrumentation
+metrics.init_app(app, [shard.engine for shard in shards])
+
+# The schema is created and migrated by `python initialize_db.py`, not on
+# import, so booting a worker touches no database. Each process checks the
+# schema version once, on its first request or in warm_up().
+schema_ready = False
+schema_lock = threading.Lock()
+
+def ensure_schema():
+    global schema_ready
+    if schema_ready:
+        return
+    with schema_lock:
+        if schema_ready:
+            return
+        for shard in shards:
+            check_schema(shard.engine)
+        schema_ready = True
+
+@app.before_request
+def require_schema():
+    if request.endpoint == "static":
+        return None
+    try:
+        ensure_schema()
+    except SchemaError as e:
+        # Not cached: workers recover without a restart once migrations have run
+        logger.error(str(e))
+        return jsonify({"error": str(e)}), 503
+    return None
+
+def warm_up(background=True):
+    # Does the first-request work ahead of time: the schema check, SQLAlchemy
+    # mapper configuration and one pooled connection per shard. Call it after
+    # the worker has started (e.g. from a post_fork hook) so it runs off the
+    # request path.
+    def run():
+        try:
+            ensure_schema()
+            configure_mappers()
+            for shard in shards:
+                with shard.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+        except Exception as e:
+            logger.warning(f"Warm-up failed: {e}")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="memorieden-warmup", daemon=True)
+    thread.start()
+    return thread
+
+# Dependency to get DB session (shard 0 unless a user's shard is given)
+def get_db(shard=None):
+    db = (shard or shards[0]).SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+def find_memory(memory_id, model=Memory):
+    # Memory ids do not encode a shard (users can be rebalanced), so probe each
+    # shard's unique index; returns (db, memory) or (None, None). model is
+    # Memory for the hot tier or ArchivedMemory for the cold one.
+    for shard in shards:
+        db = next(get_db(shard))
+        memory = db.query(model).filter(model.memory_id == memory_id).first()
+        if memory:
+            return db, memory
+        db.close()
+    return None, None
+
+def shard_of(db):
+    # The shard a session from get_db() is bound to
+    return next(shard for shard in shards if shard.engine is db.get_bind())
+
 # Helper Functions
 def get_or_create_user(db: Session, user_id: str, meta=None):
     user = db.query(User).filter(User.user_id == user_id).first()
@@ -45,6 +124,89 @@ def get_or_create_user(db: Session, user_id: str, meta=None):
         db.refresh(user)
     return user
 
+def get_or_create_users(db: Session, user_ids):
+    # Resolve many external user ids with one query; missing users are added to the session
+    users = {user.user_id: user for user in db.query(User).filter(User.user_id.in_(user_ids)).all()}
+    for user_id in user_ids:
+        if user_id not in users:
+            users[user_id] = User(user_id=user_id)
+            db.add(users[user_id])
+    db.flush()
+    return users
+
+def insert_fts_rows(db, rows):
+    # Into every registered FTS index (see fts.py)
+    fts.insert_rows(db, rows)
+
+def apply_update(db, memory, new_content):
+    # History, content, search index, signature and change log for an edit; the caller commits
+    history = History(
+        memory_id=memory.id,
+        prev_value=memory.content,
+        new_value=new_content
+    )
+    db.add(history)
+
+    memory.content = new_content
+
+    fts.update_content(db, memory.memory_id, new_content)
+
+    dedup.refresh_signature(db, memory)
+    record_change(db, "update", memory.memory_id, memory.user.user_id if memory.user else None)
+
+def check_duplicate(db, policy, content, user):
+    # Returns (signature, match); match is (memory, cluster_id, similarity) or None
+    if policy == "off":
+        return None, None
+    sig = dedup.signature(content)
+    return sig, dedup.find_duplicate(db, sig, user.id if user else None)
+
+# Maximum number of memories accepted by one bulk add request
+MAX_BULK_MEMORIES = 1000
+
+# Largest page served by the paginated listings (/memories/all, /users/all, /users/search)
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(*key):
+    # Opaque, URL-safe cursor holding the sort key of the last row on a page
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(key, list) or not all(isinstance(part, str) for part in key):
+        raise ValueError("Invalid cursor.")
+    return key
+
+def page_args():
+    # (limit, cursor) for paginated listings; limit is None when the caller
+    # wants the whole list in one response
+    limit = request.args.get("limit")
+    if not limit:
+        if request.args.get("cursor"):
+            raise ValueError("cursor requires limit.")
+        return None, None
+    try:
+        limit = max(min(int(limit), MAX_PAGE_SIZE), 1)
+    except ValueError:
+        raise ValueError("limit must be a number.")
+    cursor = request.args.get("cursor")
+    return limit, decode_cursor(cursor) if cursor else None
+
+def is_database_locked(e):
+    return isinstance(e, OperationalError) and "database is locked" in str(e)
+
+@app.errorhandler(OperationalError)
+def handle_operational_error(e):
+    # SQLite write contention is transient; tell clients to back off and retry
+    if is_database_locked(e):
+        logger.warning(f"Database is locked on {request.method} {request.path}.")
+        return jsonify({"error": "database is locked"}), 503, {"Retry-After": "1"}
+    logger.error(f"Database error on {request.method} {request.path}: {e}")
+    return jsonify({"error": "A database error occurred."}), 500
+
 # Web Interface Route
 @app.route("/", methods=["GET"])
 def index():
@@ -60,17 +222,43 @@ def add_memory():
     content = data.get("content")
     user_id = data.get("user_id")
     metadata = data.get("metadata")
+    policy = data.get("dedup") or dedup.DEFAULT_POLICY
 
     if not content:
         return jsonify({"error": "Content is required."}), 400
+    try:
+        dedup.check_policy(policy)
+    except ValueError as e:
+        return jsonify({"error": f"{e}."}), 400
 
     memory_id = f"mem_{uuid.uuid4().hex[:8]}"
 
-    db_gen = get_db()
+    db_gen = get_db(shard_for(user_id))
     db = next(db_gen)
 
     user = get_or_create_user(db, user_id) if user_id else None
 
+    sig, match = check_duplicate(db, policy, content, user)
+    if match and policy == "reject":
+        logger.info(f"Rejected near-duplicate of memory '{match[0].memory_id}'.")
+        return jsonify({
+            "error": "Near-duplicate of an existing memory.",
+            "duplicate_of": match[0].memory_id,
+            "similarity": round(match[2], 3)
+        }), 409
+    if match and policy == "merge":
+        try:
+            apply_update(db, match[0], content)
+        except Exception as e:
+            if is_database_locked(e):
+                raise
+            logger.error(f"Failed to update FTS5 table: {e}")
+            return jsonify({"error": "Failed to update memory in search index."}), 500
+        db.commit()
+        notifier.notify()
+        logger.info(f"Merged near-duplicate into memory '{match[0].memory_id}'.")
+        return jsonify({"memory_id": match[0].memory_id, "status": "merged", "similarity": round(match[2], 3)}), 200
+
     memory = Memory(
         memory_id=memory_id,
         user_id=user.id if user else None,
@@ -79,21 +267,154 @@ def add_memory():
     )
     db.add(memory)
 
-    # Add entry to FTS5 virtual table
+    # Add entry to the FTS5 virtual tables
     try:
-        db.execute(text("""
-            INSERT INTO memories_fts (content, memory_id) VALUES (:content, :memory_id)
-        """), {"content": content, "memory_id": memory_id})
+        insert_fts_rows(db, [{"content": content, "memory_id": memory_id}])
     except Exception as e:
+        if is_database_locked(e):
+            raise
         logger.error(f"Failed to insert into FTS5 table: {e}")
         return jsonify({"error": "Failed to add memory to search index."}), 500
 
+    if sig is not None:
+        db.flush()
+        dedup.store_signature(db, memory, sig, cluster_id=match[1] if match else None)
+
+    record_change(db, "add", memory_id, user_id)
+
     db.commit()
     db.refresh(memory)
+    notifier.notify()
 
     logger.info(f"Memory '{memory_id}' added successfully.")
 
-    return jsonify({"memory_id": memory_id, "status": "success"}), 201
+    response = {"memory_id": memory_id, "status": "success"}
+    if match:
+        response["duplicate_of"] = match[0].memory_id
+    return jsonify(response), 201
+
+@app.route("/memories/add_bulk", methods=["POST"])
+def add_memories_bulk():
+    data = request.get_json()
+    items = data.get("memories")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "memories must be a non-empty list."}), 400
+    if len(items) > MAX_BULK_MEMORIES:
+        return jsonify({"error": f"At most {MAX_BULK_MEMORIES} memories per request."}), 400
+    if any(not isinstance(item, dict) or not item.get("content") for item in items):
+        return jsonify({"error": "Content is required for every memory."}), 400
+
+    policy = data.get("dedup") or dedup.DEFAULT_POLICY
+    try:
+        dedup.check_policy(policy)
+    except ValueError as e:
+        return jsonify({"error": f"{e}."}), 400
+
+    results = [{"memory_id": f"mem_{uuid.uuid4().hex[:8]}", "status": "success"} for _ in items]
+
+    # One transaction per shard. Every shard's writes are made, holding that
+    # shard's write lock, before any shard commits, so a lock timeout or an
+    # index error leaves nothing behind and the whole batch can be resent.
+    by_shard = {}
+    for item, result in zip(items, results):
+        by_shard.setdefault(shard_index(item.get("user_id")), []).append((item, result))
+
+    sessions = []
+    try:
+        for index, group in sorted(by_shard.items()):
+            db = shards[index].SessionLocal()
+            sessions.append((db, group))
+
+            user_ids = {item["user_id"] for item, _ in group if item.get("user_id")}
+            users = get_or_create_users(db, user_ids) if user_ids else {}
+
+            fts_rows = []
+            added = []
+            try:
+                for item, result in group:
+                    user = users.get(item.get("user_id"))
+
+                    sig, match = check_duplicate(db, policy, item["content"], user)
+                    if match:
+                        result["duplicate_of"] = match[0].memory_id
+                        result["similarity"] = round(match[2], 3)
+                    if match and policy == "reject":
+                        result.update(memory_id=None, status="rejected")
+                        continue
+                    if match and policy == "merge":
+                        # The target may be earlier in this batch; index pending rows first
+                        if fts_rows:
+                            insert_fts_rows(db, fts_rows)
+                            fts_rows = []
+                        apply_update(db, match[0], item["content"])
+                        result.update(memory_id=match[0].memory_id, status="merged")
+                        continue
+
+                    memory = Memory(
+                        memory_id=result["memory_id"],
+                        user_id=user.id if user else None,
+                        content=item["content"],
+                        meta=item.get("metadata")
+                    )
+                    db.add(memory)
+                    fts_rows.append({"content": item["content"], "memory_id": result["memory_id"]})
+                    added.append((result["memory_id"], item.get("user_id")))
+
+                    if sig is not None:
+                        # Flush so later items in this batch see this memory as a candidate
+                        db.flush()
+                        dedup.store_signature(db, memory, sig, cluster_id=match[1] if match else None)
+                        db.flush()
+
+                if fts_rows:
+                    insert_fts_rows(db, fts_rows)
+            except Exception as e:
+                if is_database_locked(e):
+                    raise
+                logger.error(f"Failed to write FTS5 table: {e}")
+                return jsonify({"error": "Failed to add memories to search index."}), 500
+
+            record_changes(db, "add", added)
+            db.flush()
+
+        # A commit can still time out waiting for readers. Shards committed
+        # before it stay committed, so report the rest per item and let the
+        # client resend only those.
+        failed = False
+        for position, (db, group) in enumerate(sessions):
+            if not failed:
+                try:
+                    db.commit()
+                    continue
+                except OperationalError as e:
+                    if position == 0 or not is_database_locked(e):
+                        raise
+                    logger.warning(f"Bulk add committed {position} of {len(sessions)} shards: {e}")
+                    failed = True
+            for _, result in group:
+                result.update(memory_id=None, status="failed")
+    finally:
+        # Rolls back whatever did not commit
+        for db, _ in sessions:
+            db.close()
+
+    notifier.notify()
+
+    if failed:
+        return jsonify({
+            "memory_ids": [result["memory_id"] for result in results],
+            "results": results,
+            "status": "partial"
+        }), 207
+
+    logger.info(f"{len(items)} memories processed in bulk.")
+
+    return jsonify({
+        "memory_ids": [result["memory_id"] for result in results],
+        "results": results,
+        "status": "success"
+    }), 201
 
 @app.route("/memories/update", methods=["PUT"])
 def update_memory():
@@ -104,39 +425,169 @@ def update_memory():
     if not memory_id or not new_content:
         return jsonify({"error": "memory_id and new_content are required."}), 400
 
-    db_gen = get_db()
-    db = next(db_gen)
-
-    memory = db.query(Memory).filter(Memory.memory_id == memory_id).first()
+    db, memory = find_memory(memory_id)
     if not memory:
-        return jsonify({"error": "Memory not found."}), 404
+        # Editing a cold memory brings it back to the hot tier first
+        db, archived = find_memory(memory_id, ArchivedMemory)
+        if not archived:
+            return jsonify({"error": "Memory not found."}), 404
+        memory = tiering.restore(db, archived)
 
-    # Save history
-    history = History(
-        memory_id=memory.id,
-        prev_value=memory.content,
-        new_value=new_content
-    )
-    db.add(history)
-
-    # Update memory content
-    memory.content = new_content
-
-    # Update FTS5 virtual table
+    # Save history, update content and the FTS5 virtual table
     try:
-        db.execute(text("""
-            UPDATE memories_fts SET content = :new_content WHERE memory_id = :memory_id
-        """), {"new_content": new_content, "memory_id": memory_id})
+        apply_update(db, memory, new_content)
     except Exception as e:
+        if is_database_locked(e):
+            raise
         logger.error(f"Failed to update FTS5 table: {e}")
         return jsonify({"error": "Failed to update memory in search index."}), 500
 
     db.commit()
     db.refresh(memory)
+    notifier.notify()
 
     logger.info(f"Memory '{memory_id}' updated successfully.")
 
-    return jsonify({"memory_id": memory_id, "status": "updated"}), 200
+    return jsonify({"memory_id": memory_id, "user": memory.user.user_id if memory.user else None, "status": "updated"}), 200
+
+@app.route("/memories/delete/<memory_id>", methods=["DELETE"])
+def delete_memory(memory_id):
+    db, memory = find_memory(memory_id)
+    if not memory:
+        db, archived = find_memory(memory_id, ArchivedMemory)
+        if not archived:
+            return jsonify({"error": "Memory not found."}), 404
+        user_id = archived.user.user_id if archived.user else None
+        tiering.delete_archived(db, archived)
+        record_change(db, "delete", memory_id, user_id)
+        db.commit()
+        notifier.notify()
+        logger.info(f"Archived memory '{memory_id}' deleted successfully.")
+        return jsonify({"memory_id": memory_id, "user": user_id, "status": "deleted"}), 200
+
+    user_id = memory.user.user_id if memory.user else None
+
+    try:
+        fts.delete_memory(db, memory_id)
+    except Exception as e:
+        if is_database_locked(e):
+            raise
+        logger.error(f"Failed to delete from FTS5 table: {e}")
+        return jsonify({"error": "Failed to remove memory from search index."}), 500
+
+    db.query(History).filter(History.memory_id == memory.id).delete()
+    db.delete(memory)
+    record_change(db, "delete", memory_id, user_id)
+
+    db.commit()
+    notifier.notify()
+
+    logger.info(f"Memory '{memory_id}' deleted successfully.")
+
+    return jsonify({"memory_id": memory_id, "user": user_id, "status": "deleted"}), 200
+
+def search_shard(shard, query, user_id=None, limit=None, collapse=False, include_cold=False):
+    # FTS search on one shard; returns scored results, best first
+    db_gen = get_db(shard)
+    db = next(db_gen)
+
+    try:
+        user = None
+        if user_id:
+            user = db.query(User).filter(User.user_id == user_id).first()
+            if not user:
+                logger.info(f"No user found with user_id: {user_id}")
+                return []
+
+        # The FTS table built with the user's (or the deployment's) tokenizer
+        fts_table = fts.search_table(db, user)
+        if fts_table is None:
+            logger.error(f"No FTS index is ready on shard {shard.index}.")
+            return []
+
+        # Sanitize the input by escaping single quotes to prevent SQL injection
+        sanitized_query = query.replace("'", "''")
+        sanitized_query = f'"{sanitized_query}"'
+
+        # Stage 1: Perform FTS search to get memory_ids from content and meta
+        fts_query = f"""
+            SELECT memory_id
+            FROM {fts_table}
+            WHERE content MATCH '{sanitized_query}'
+            ORDER BY rowid ASC  -- Default ordering
+        """
+
+        logger.info(f"Executing FTS search query on shard {shard.index}:\n{fts_query}")
+        fts_result = db.execute(text(fts_query))
+
+        # Extract memory_ids from the result
+        memory_ids = [row[0] for row in fts_result]
+
+        memories = []
+        if memory_ids:
+            # Stage 2: Fetch memory details for the found memory_ids
+            memories_query = db.query(Memory).filter(Memory.memory_id.in_(memory_ids))
+            if user:
+                memories_query = memories_query.filter(Memory.user_id == user.id)
+
+            memories = memories_query.all()
+
+        # The cold tier has its own index and is only searched on request
+        archived = tiering.search_cold(db, sanitized_query, user) if include_cold else []
+        if not memories and not archived:
+            return []
+
+        # Calculate rank based on keyword matches
+        response_memories = [
+            {
+                "memory_id": mem.memory_id,
+                "user": mem.user.user_id if mem.user else None,
+                "content": mem.content,
+                "metadata": mem.meta,
+                "score": calculate_rank(mem.content, query)  # Custom rank
+            }
+            for mem in memories
+        ]
+        response_memories += [
+            {
+                "memory_id": mem.memory_id,
+                "user": mem.user.user_id if mem.user else None,
+                "content": mem.content,
+                "metadata": mem.meta,
+                "score": calculate_rank(mem.content, query),
+                "tier": "cold"
+            }
+            for mem in archived
+        ]
+
+        if collapse:
+            # Keep the best-scoring memory of each near-duplicate cluster;
+            # cold memories have no signature and are their own cluster
+            clusters = dedup.cluster_ids(db, [mem.id for mem in memories])
+            best = {}
+            sizes = collections.Counter()
+            for mem, result in zip(memories + archived, response_memories):
+                key = clusters.get(mem.id, mem.memory_id) if result.get("tier") != "cold" else mem.memory_id
+                sizes[key] += 1
+                if key not in best or result["score"] > best[key]["score"]:
+                    best[key] = result
+            response_memories = [dict(result, duplicates=sizes[key] - 1) for key, result in best.items()]
+
+        results = top_results(response_memories, limit)
+
+        # Count the returned hot memories as read; written in batches by the tracker
+        hot_pks = {mem.memory_id: mem.id for mem in memories}
+        tiering.tracker.record(shard, [hot_pks[result["memory_id"]] for result in results if result["memory_id"] in hot_pks])
+    finally:
+        db.close()
+
+    return results
+
+def top_results(memories, limit=None):
+    # Sort the results by rank descending (more matches first)
+    if limit:
+        return heapq.nlargest(limit, memories, key=lambda x: x['score'])
+    return sorted(memories, key=lambda x: x['score'], reverse=True)
 
 @app.route("/memories/search", methods=["GET"])
 def search_memories():
@@ -147,104 +598,129 @@ def search_memories():
         logger.warning("Search attempt without query parameter.")
         return jsonify({"error": "Query parameter is required."}), 400
 
-    db_gen = get_db()
-    db = next(db_gen)
-
-    # Sanitize the input by escaping single quotes to prevent SQL injection
-    sanitized_query = query.replace("'", "''")
-    sanitized_query = f'"{sanitized_query}"'
+    try:
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+    except ValueError:
+        return jsonify({"error": "limit must be a number."}), 400
 
-    # Stage 1: Perform FTS search to get memory_ids from content and meta
-    fts_query = f"""
-        SELECT memory_id
-        FROM memories_fts
-        WHERE content MATCH '{sanitized_query}'
-        ORDER BY rowid ASC  -- Default ordering
-    """
+    collapse = request.args.get("collapse", "").lower() in ("1", "true", "yes")
+    include_cold = request.args.get("include_cold", "").lower() in ("1", "true", "yes")
 
     try:
-        logger.info(f"Executing FTS search query:\n{fts_query}")
-        fts_result = db.execute(text(fts_query))
+        if user_id:
+            # A user's memories live on exactly one shard
+            response_memories = search_shard(shard_for(user_id), query, user_id, limit, collapse, include_cold)
+        else:
+            # Cross-user search fans out to every shard in parallel and merges top-k
+            parts = map_shards(lambda shard: search_shard(shard, query, limit=limit, collapse=collapse, include_cold=include_cold))
+            response_memories = top_results([mem for part in parts for mem in part], limit)
     except Exception as e:
         logger.error(f"Error during FTS search execution: {e}")
         return jsonify({"error": "An error occurred while searching memories."}), 500
 
-    # Extract memory_ids from the result
-    memory_ids = [row[0] for row in fts_result]
-
-    if not memory_ids:
-        logger.info("No memories found matching the query.")
-        return jsonify({"memories": []}), 200
-
-    # Stage 2: Fetch memory details for the found memory_ids
-    memories_query = db.query(Memory).filter(Memory.memory_id.in_(memory_ids))
-    if user_id:
-        user = db.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            logger.info(f"No user found with user_id: {user_id}")
-            return jsonify({"memories": []}), 200
-        memories_query = memories_query.filter(Memory.user_id == user.id)
-
-    memories = memories_query.all()
+    logger.info(f"Search completed. Found {len(response_memories)} memory/memories.")
 
-    # Calculate rank based on keyword matches
-    response_memories = [
-        {
-            "memory_id": mem.memory_id,
-            "user": mem.user.user_id if mem.user else None,
-            "content": mem.content,
-            "metadata": mem.meta,
-            "score": calculate_rank(mem.content, query)  # Custom rank
-        }
-        for mem in memories
-    ]
+    return jsonify({"memories": response_memories}), 200
 
-    # Sort the results by rank descending (more matches first)
-    response_memories.sort(key=lambda x: x['score'], reverse=True)
+def memory_sort_key(mem):
+    return (mem["created_at"], mem["memory_id"])
 
-    logger.info(f"Search completed. Found {len(response_memories)} memory/memories.")
+def list_shard_memories(shard, user_id=None, limit=None, after=None, include_cold=False):
+    # With limit, returns one keyset page, newest first: memories strictly
+    # older than after = (created_at, memory_id)
+    db_gen = get_db(shard)
+    db = next(db_gen)
 
-    return jsonify({"memories": response_memories}), 200
+    try:
+        user = db.query(User).filter(User.user_id == user_id).first() if user_id else None
+        now = datetime.utcnow()
+
+        parts = []
+        for model in (Memory, ArchivedMemory) if include_cold else (Memory,):
+            memories_query = db.query(model)
+
+            if user:
+                memories_query = memories_query.filter(model.user_id == user.id)
+
+            if limit is not None:
+                if after:
+                    created_at, memory_id = after
+                    memories_query = memories_query.filter(
+                        tuple_(model.created_at, model.memory_id) < (created_at, memory_id)
+                    )
+                memories_query = memories_query.order_by(model.created_at.desc(), model.memory_id.desc()).limit(limit)
+
+            parts.append([
+                {
+                    "memory_id": mem.memory_id,
+                    "content": mem.content,
+                    "metadata": mem.meta,
+                    "created_at": mem.created_at.isoformat(),
+                    "updated_at": mem.updated_at.isoformat(),
+                    "access_count": mem.access_count,
+                    "importance": round(tiering.current_importance(mem, now), 4),
+                    **({"tier": "cold"} if model is ArchivedMemory else {})
+                }
+                for mem in memories_query.all()
+            ])
+
+        if limit is None:
+            return [mem for part in parts for mem in part]
+        return list(heapq.merge(*parts, key=memory_sort_key, reverse=True))[:limit]
+    finally:
+        db.close()
 
 @app.route("/memories/all", methods=["GET"])
 def get_all_memories():
     user_id = request.args.get("user_id")
+    include_cold = request.args.get("include_cold", "").lower() in ("1", "true", "yes")
 
-    db_gen = get_db()
-    db = next(db_gen)
-
-    memories_query = db.query(Memory)
-
+    try:
+        limit, after = page_args()
+        if after is not None:
+            if len(after) != 2:
+                raise ValueError("Invalid cursor.")
+            after = (datetime.fromisoformat(after[0]), after[1])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if limit is None:
+        if user_id:
+            response_memories = list_shard_memories(shard_for(user_id), user_id, include_cold=include_cold)
+        else:
+            parts = map_shards(lambda shard: list_shard_memories(shard, include_cold=include_cold))
+            response_memories = [mem for part in parts for mem in part]
+        return jsonify({"memories": response_memories}), 200
+
+    # Fetch one row past the page to know whether another page follows
     if user_id:
-        user = db.query(User).filter(User.user_id == user_id).first()
-        if user:
-            memories_query = memories_query.filter(Memory.user_id == user.id)
-
-    memories = memories_query.all()
+        rows = list_shard_memories(shard_for(user_id), user_id, limit + 1, after, include_cold)
+    else:
+        parts = map_shards(lambda shard: list_shard_memories(shard, limit=limit + 1, after=after, include_cold=include_cold))
+        rows = list(heapq.merge(*parts, key=memory_sort_key, reverse=True))
 
-    response_memories = [
-        {
-            "memory_id": mem.memory_id,
-            "content": mem.content,
-            "metadata": mem.meta,
-            "created_at": mem.created_at.isoformat(),
-            "updated_at": mem.updated_at.isoformat()
-        }
-        for mem in memories
-    ]
-
-    return jsonify({"memories": response_memories}), 200
+    page = rows[:limit]
+    next_cursor = encode_cursor(*memory_sort_key(page[-1])) if len(rows) > limit else None
+    return jsonify({"memories": page, "next_cursor": next_cursor}), 200
 
 @app.route("/memories/history/<memory_id>", methods=["GET"])
 def get_memory_history(memory_id):
-    db_gen = get_db()
-    db = next(db_gen)
-
-    memory = db.query(Memory).filter(Memory.memory_id == memory_id).first()
-    if not memory:
-        return jsonify({"error": "Memory not found."}), 404
-
-    history_records = db.query(History).filter(History.memory_id == memory.id).order_by(History.updated_at.desc()).all()
+    db, memory = find_memory(memory_id)
+    if memory:
+        tiering.tracker.record(shard_of(db), [memory.id])
+        history_model = History
+    else:
+        db, memory = find_memory(memory_id, ArchivedMemory)
+        if not memory:
+            return jsonify({"error": "Memory not found."}), 404
+        history_model = ArchivedHistory
+
+    history_records = (
+        db.query(history_model)
+        .filter(history_model.memory_id == memory.id)
+        .order_by(history_model.updated_at.desc())
+        .all()
+    )
 
     response_history = [
         {
@@ -257,6 +733,70 @@ def get_memory_history(memory_id):
 
     return jsonify({"history": response_history}), 200
 
+# --- Change Feed ---
+
+@app.route("/changes", methods=["GET"])
+def get_changes():
+    since = request.args.get("since")
+
+    try:
+        timeout = min(float(request.args.get("timeout", 0)), MAX_WAIT_SECONDS)
+        limit = max(min(int(request.args.get("limit", MAX_BATCH_SIZE)), MAX_BATCH_SIZE), 1)
+    except ValueError:
+        return jsonify({"error": "timeout and limit must be numbers."}), 400
+
+    dbs = [next(get_db(shard)) for shard in shards]
+
+    deadline = time.monotonic() + timeout
+    while True:
+        changes, cursor, reset, has_more = read_sharded_changes(dbs, since, limit=limit)
+        remaining = deadline - time.monotonic()
+        if changes or reset or since is None or remaining <= 0:
+            break
+        # Release the connections while waiting; re-check at least once a second
+        # so commits from other worker processes are seen too
+        for db in dbs:
+            db.close()
+        notifier.wait(min(remaining, 1.0))
+
+    for db in dbs:
+        db.close()
+
+    return jsonify({"changes": changes, "cursor": cursor, "reset": reset, "has_more": has_more}), 200
+
+# --- Export / Import ---
+
+@app.route("/export", methods=["GET"])
+def export_store():
+    import transfer
+
+    user_id = request.args.get("user_id")
+
+    def generate():
+        yield from transfer.export_chunks(transfer.export_store(user_id=user_id))
+
+    filename = f"memorieden-{user_id or 'all'}.ndjson.gz"
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/gzip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.route("/import", methods=["POST"])
+def import_store():
+    import transfer
+
+    try:
+        counts = transfer.import_stream(request.stream)
+    except (ValueError, KeyError, OSError, EOFError, zlib.error) as e:
+        # A truncated gzip body raises EOFError, corrupt compressed data zlib.error
+        logger.error(f"Import failed: {e}")
+        return jsonify({"error": f"Invalid export stream: {e}"}), 400
+
+    notifier.notify()
+
+    return jsonify({"counts": counts, "status": "success"}), 201
+
 # --- User Endpoints ---
 
 @app.route("/users/add", methods=["POST"])
@@ -264,18 +804,24 @@ def add_user():
     data = request.get_json()
     user_id = data.get("user_id")
     meta = data.get("metadata")
+    tokenizer = data.get("tokenizer")
 
     if not user_id:
         return jsonify({"error": "user_id is required."}), 400
+    if tokenizer is not None:
+        try:
+            fts.check_tokenizer(tokenizer)
+        except ValueError as e:
+            return jsonify({"error": f"{e}."}), 400
 
-    db_gen = get_db()
+    db_gen = get_db(shard_for(user_id))
     db = next(db_gen)
 
     existing_user = db.query(User).filter(User.user_id == user_id).first()
     if existing_user:
         return jsonify({"error": "User already exists."}), 400
 
-    user = User(user_id=user_id, meta=meta)
+    user = User(user_id=user_id, meta=meta, tokenizer=tokenizer)
     db.add(user)
     db.commit()
     db.refresh(user)
@@ -284,6 +830,87 @@ def add_user():
 
     return jsonify({"user_id": user.user_id, "status": "success"}), 201
 
+@app.route("/users/update", methods=["PUT"])
+def update_user():
+    data = request.get_json()
+    user_id = data.get("user_id")
+
+    if not user_id:
+        return jsonify({"error": "user_id is required."}), 400
+    if data.get("tokenizer") is not None:
+        try:
+            fts.check_tokenizer(data["tokenizer"])
+        except ValueError as e:
+            return jsonify({"error": f"{e}."}), 400
+
+    db_gen = get_db(shard_for(user_id))
+    db = next(db_gen)
+
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        return jsonify({"error": "User not found."}), 404
+
+    # Only the fields present are changed; a null tokenizer reverts to the deployment default
+    if "metadata" in data:
+        user.meta = data["metadata"]
+    retokenized = "tokenizer" in data and data["tokenizer"] != user.tokenizer
+    if retokenized:
+        user.tokenizer = data["tokenizer"]
+        # Searches now use another index, so every cached result for the user is stale
+        record_change(db, "tokenizer", "*", user_id)
+    db.commit()
+    if retokenized:
+        notifier.notify()
+
+    logger.info(f"User '{user_id}' updated successfully.")
+
+    return jsonify({"user_id": user_id, "tokenizer": user.tokenizer, "status": "updated"}), 200
+
+def list_shard_users(shard, user_id_contains=None, limit=None, after=None):
+    # With limit, returns one keyset page ordered by user_id, after the user_id in after
+    db_gen = get_db(shard)
+    db = next(db_gen)
+
+    try:
+        users_query = db.query(User)
+        if user_id_contains:
+            users_query = users_query.filter(User.user_id.contains(user_id_contains))
+        if limit is not None:
+            if after:
+                users_query = users_query.filter(User.user_id > after[0])
+            users_query = users_query.order_by(User.user_id).limit(limit)
+
+        return [
+            {
+                "user_id": user.user_id,
+                "metadata": user.meta,
+                "tokenizer": user.tokenizer,
+                "created_at": user.created_at.isoformat()
+            }
+            for user in users_query.all()
+        ]
+    finally:
+        db.close()
+
+def list_users_page(user_id_contains=None):
+    try:
+        limit, after = page_args()
+        if after is not None and len(after) != 1:
+            raise ValueError("Invalid cursor.")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Users can be on any shard
+    parts = map_shards(lambda shard: list_shard_users(shard, user_id_contains, None if limit is None else limit + 1, after))
+
+    if limit is None:
+        return jsonify({"users": [user for part in parts for user in part]}), 200
+
+    rows = list(heapq.merge(*parts, key=lambda user: user["user_id"]))
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1]["user_id"]) if len(rows) > limit else None
+    return jsonify({"users": page, "next_cursor": next_cursor}), 200
+
 @app.route("/users/search", methods=["GET"])
 def search_users():
     user_id = request.args.get("user_id")
@@ -291,40 +918,59 @@ def search_users():
     if not user_id:
         return jsonify({"error": "user_id parameter is required."}), 400
 
-    db_gen = get_db()
-    db = next(db_gen)
+    return list_users_page(user_id)
 
-    users = db.query(User).filter(User.user_id.contains(user_id)).all()
+@app.route("/users/all", methods=["GET"])
+def list_all_users():
+    return list_users_page()
 
-    response_users = [
-        {
-            "user_id": user.user_id,
-            "metadata": user.meta,
-            "created_at": user.created_at.isoformat()
-        }
-        for user in users
-    ]
+# --- Metrics Endpoints ---
 
-    return jsonify({"users": response_users}), 200
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    def collect():
+        dbs = [next(get_db(shard)) for shard in shards]
+        try:
+            return metrics.collect_store_gauges(dbs)
+        finally:
+            for db in dbs:
+                db.close()
 
-@app.route("/users/all", methods=["GET"])
-def list_all_users():
-    db_gen = get_db()
-    db = next(db_gen)
+    try:
+        gauges = metrics.store_gauges.get(collect)
+    except Exception as e:
+        logger.error(f"Failed to collect store gauges: {e}")
+        gauges = None
 
-    users = db.query(User).all()
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
 
-    response_users = [
-        {
-            "user_id": user.user_id,
-            "metadata": user.meta,
-            "created_at": user.created_at.isoformat()
-        }
-        for user in users
-    ]
+@app.route("/metrics/profiling", methods=["GET"])
+def get_profiling():
+    return Response(metrics.profiler.report(), mimetype="text/plain")
+
+@app.route("/metrics/profiling", methods=["PUT"])
+def configure_profiling():
+    data = request.get_json()
+
+    if "enabled" not in data:
+        return jsonify({"error": "enabled is required."}), 400
+
+    try:
+        metrics.profiler.configure(
+            data["enabled"],
+            mode=data.get("mode"),
+            sample_rate=data.get("sample_rate"),
+            interval=data.get("interval")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify({"users": response_users}), 200
+    return jsonify(metrics.profiler.status()), 200
 
 # --- Run the Flask app ---
 if __name__ == "__main__":
+    # Development server: migrate in place, then serve
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    warm_up()
     app.run(debug=True)
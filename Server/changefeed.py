@@ -0,0 +1,105 @@
+# changefeed.py
+from sqlalchemy import func
+from models import ChangeLog
+import threading
+
+# Upper bound on how long one /changes request may block
+MAX_WAIT_SECONDS = 30.0
+
+# Maximum number of changes returned per /changes request
+MAX_BATCH_SIZE = 1000
+
+def record_change(db, op, memory_id, user_id):
+    # Adds the change to the caller's session so it commits with the mutation
+    db.add(ChangeLog(op=op, memory_id=memory_id, user_id=user_id))
+
+def record_changes(db, op, rows):
+    # rows: iterable of (memory_id, user_id)
+    db.add_all([ChangeLog(op=op, memory_id=memory_id, user_id=user_id) for memory_id, user_id in rows])
+
+def read_changes(db, cursor, limit=MAX_BATCH_SIZE):
+    # Returns (changes, next_cursor, reset, has_more).
+    # The cursor is the last seen sequence number as a string; None starts
+    # at the current head, and an unusable cursor asks the consumer to resync.
+    head = db.query(func.max(ChangeLog.seq)).scalar() or 0
+    if cursor is None:
+        return [], str(head), False, False
+
+    try:
+        since = int(cursor)
+    except ValueError:
+        return [], str(head), True, False
+    oldest = db.query(func.min(ChangeLog.seq)).scalar() or head + 1
+    if since > head or since < oldest - 1:
+        return [], str(head), True, False
+
+    rows = (
+        db.query(ChangeLog)
+        .filter(ChangeLog.seq > since)
+        .order_by(ChangeLog.seq)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = [
+        {
+            "seq": row.seq,
+            "op": row.op,
+            "memory_id": row.memory_id,
+            "user": row.user_id,
+            "changed_at": row.changed_at.isoformat()
+        }
+        for row in rows
+    ]
+    next_cursor = str(rows[-1].seq) if rows else str(since)
+    return changes, next_cursor, False, has_more
+
+def read_sharded_changes(dbs, cursor, limit=MAX_BATCH_SIZE):
+    # Same contract as read_changes across shards. Each shard keeps its own
+    # sequence; the cursor joins them with "." in shard order, so an unsharded
+    # store keeps plain integer cursors. Changes to different users on
+    # different shards have no defined relative order.
+    if len(dbs) == 1:
+        return read_changes(dbs[0], cursor, limit)
+
+    parts = None if cursor is None else cursor.split(".")
+    if parts is not None and len(parts) != len(dbs):
+        # Shard count changed since the cursor was issued
+        parts = None
+        reset = True
+    else:
+        reset = False
+
+    changes, cursors, has_more = [], [], False
+    for i, db in enumerate(dbs):
+        shard_changes, shard_cursor, shard_reset, shard_more = read_changes(
+            db, parts[i] if parts else None, limit=limit - len(changes)
+        )
+        if shard_reset:
+            _, head, _, _ = read_sharded_changes(dbs, None)
+            return [], head, True, False
+        changes.extend(shard_changes)
+        cursors.append(shard_cursor)
+        has_more = has_more or shard_more
+    return changes, ".".join(cursors), reset, has_more
+
+class ChangeNotifier:
+    # Wakes long-polling /changes requests when this process commits a change.
+    # Other worker processes are picked up by the periodic re-check instead.
+
+    def __init__(self):
+        self.version = 0
+        self.condition = threading.Condition()
+
+    def notify(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, timeout):
+        with self.condition:
+            version = self.version
+            self.condition.wait_for(lambda: self.version != version, timeout=timeout)
+
+notifier = ChangeNotifier()
@@ -0,0 +1,295 @@
+# consolidate.py
+from models import User, Memory
+from changefeed import record_change
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import text
+import argparse
+import collections
+import functools
+import importlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+import fts
+import tiering
+
+logger = logging.getLogger(__name__)
+
+# Memories not edited or read for this long are consolidated by `python consolidate.py`
+MIN_AGE_DAYS = float(os.environ.get("MEMORIEDEN_CONSOLIDATE_MIN_AGE_DAYS", "30"))
+
+# Metadata key naming a memory's conversation session; memories without
+# one are grouped per user
+SESSION_KEY = os.environ.get("MEMORIEDEN_SESSION_KEY", "session_id")
+
+# "module:function" taking a list of memory contents and returning the
+# condensed text. It runs in worker processes, so it must be importable there.
+SUMMARIZER = os.environ.get("MEMORIEDEN_SUMMARIZER", "consolidate:extractive_summary")
+
+# Longest text the default summarizer produces
+SUMMARY_MAX_CHARS = int(os.environ.get("MEMORIEDEN_SUMMARY_MAX_CHARS", "1000"))
+
+# Word overlap (Jaccard) at which the default summarizer treats a sentence as
+# repeating one it already picked
+REDUNDANCY = 0.8
+
+# Groups smaller than MIN_GROUP_SIZE are left alone; larger ones are split
+MIN_GROUP_SIZE = 5
+MAX_GROUP_SIZE = 50
+
+# Groups summarized per round trip to the process pool
+GROUPS_PER_BATCH = 64
+
+# --- Default summarizer ---
+
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been but by can did do does for from had has have he her
+his i if in into is it its just me my no not of on or our she so than that the their them then there
+they this to too was we were what when which who will with you your
+""".split())
+
+def _terms(sentence):
+    return [word for word in re.findall(r'\w+', sentence.lower()) if word not in STOPWORDS]
+
+def _overlap(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def extractive_summary(contents, max_chars=SUMMARY_MAX_CHARS):
+    # Picks the sentences whose words recur most across the group, skipping
+    # ones that mostly repeat a sentence already picked, and returns them in
+    # their original order, one per line. Deterministic and local.
+    sentences = []
+    seen = set()
+    for content in contents:
+        for sentence in re.split(r'(?<=[.!?])\s+|\n+', content):
+            sentence = sentence.strip()
+            key = " ".join(re.findall(r'\w+', sentence.lower()))
+            if key and key not in seen:
+                seen.add(key)
+                sentences.append(sentence)
+    if not sentences:
+        return ""
+
+    terms = [set(_terms(sentence)) for sentence in sentences]
+    frequency = collections.Counter(term for sentence_terms in terms for term in sentence_terms)
+
+    def score(i):
+        if not terms[i]:
+            return 0.0
+        return sum(frequency[term] for term in terms[i]) / len(terms[i]) ** 0.5
+
+    ranked = sorted(range(len(sentences)), key=lambda i: (-score(i), i))
+    chosen = []
+    length = 0
+    for i in ranked:
+        if any(_overlap(terms[i], terms[j]) >= REDUNDANCY for j in chosen):
+            continue
+        if chosen and length + len(sentences[i]) + 1 > max_chars:
+            continue
+        chosen.append(i)
+        length += len(sentences[i]) + 1
+    return "\n".join(sentences[i] for i in sorted(chosen))[:max_chars]
+
+@functools.lru_cache(maxsize=None)
+def load_summarizer(path):
+    module_name, _, function_name = path.partition(":")
+    if not function_name:
+        raise ValueError(f"Summarizer must be given as module:function, not {path!r}")
+    return getattr(importlib.import_module(module_name), function_name)
+
+def summarize_group(summarizer, contents):
+    # Runs in a worker process
+    return load_summarizer(summarizer)(contents)
+
+# --- Grouping ---
+
+def _session(meta):
+    if isinstance(meta, dict) and meta.get(SESSION_KEY) is not None:
+        return str(meta[SESSION_KEY])
+    return None
+
+def user_groups(db, user_pk, cutoff, min_group=MIN_GROUP_SIZE, max_group=MAX_GROUP_SIZE):
+    # Old memories of one user (None for memories without a user), split by
+    # session and then into chunks of at most max_group, oldest first
+    query = (
+        db.query(Memory.id, Memory.memory_id, Memory.content, Memory.meta, Memory.created_at,
+                 Memory.updated_at, Memory.access_count, Memory.importance, Memory.last_accessed_at)
+        .filter(Memory.user_id == user_pk if user_pk is not None else Memory.user_id.is_(None))
+        .filter(*tiering.idle_since(Memory, cutoff))
+        .order_by(Memory.created_at, Memory.id)
+    )
+    sessions = collections.defaultdict(list)
+    for row in query:
+        # Earlier summaries are left for the tiering job to archive, and
+        # originals back in the hot tier (restored) are already summarized
+        if isinstance(row.meta, dict) and ("consolidated_from" in row.meta or "consolidated_into" in row.meta):
+            continue
+        sessions[_session(row.meta)].append(row)
+
+    groups = []
+    for session, rows in sessions.items():
+        for start in range(0, len(rows), max_group):
+            chunk = rows[start:start + max_group]
+            if len(chunk) >= min_group:
+                groups.append((user_pk, session, chunk))
+    return groups
+
+def candidate_users(db, cutoff, user_id=None):
+    query = (
+        db.query(Memory.user_id)
+        .filter(*tiering.idle_since(Memory, cutoff))
+        .distinct()
+    )
+    if user_id is not None:
+        user = db.query(User).filter_by(user_id=user_id).first()
+        if user is None:
+            return []
+        query = query.filter(Memory.user_id == user.id)
+    return sorted((pk for (pk,) in query), key=lambda pk: (pk is not None, pk or 0))
+
+# --- Writing ---
+
+def write_summary(db, group, summary, summarizer, now):
+    # Adds the condensed memory and archives the originals in one transaction.
+    # Returns the new memory_id, or None if an original changed meanwhile.
+    user_pk, session, rows = group
+    pks = [row.id for row in rows]
+
+    memory_id = f"mem_{uuid.uuid4().hex[:8]}"
+    meta = {
+        "consolidated_from": [row.memory_id for row in rows],
+        "consolidated_at": now.isoformat(),
+        "summarizer": summarizer,
+    }
+    if session is not None:
+        meta[SESSION_KEY] = session
+    memory = Memory(
+        memory_id=memory_id,
+        user_id=user_pk,
+        content=summary,
+        meta=meta,
+        created_at=now,
+        updated_at=now,
+        access_count=sum(row.access_count for row in rows),
+        last_accessed_at=now,
+        # Keeps the reads of the originals, so the summary is not archived straight away
+        importance=max(1.0, sum(
+            tiering.decayed(row.importance, row.last_accessed_at or row.created_at, now) for row in rows
+        ))
+    )
+    db.add(memory)
+    fts.insert_rows(db, [{"content": summary, "memory_id": memory_id}])
+
+    # The writes above hold the shard's write lock, so no edit can commit
+    # between this check and the move
+    current = dict(db.query(Memory.id, Memory.updated_at).filter(Memory.id.in_(pks)).all())
+    if any(current.get(row.id) != row.updated_at for row in rows):
+        db.rollback()
+        return None
+
+    # Point the originals at the summary; the archive keeps their metadata
+    links = [
+        {"id": row.id, "meta": json.dumps({**(row.meta or {}), "consolidated_into": memory_id})}
+        for row in rows if row.meta is None or isinstance(row.meta, dict)
+    ]
+    if links:
+        db.execute(text("UPDATE memories SET meta = :meta WHERE id = :id"), links)
+
+    user = db.get(User, user_pk) if user_pk is not None else None
+    record_change(db, "add", memory_id, user.user_id if user else None)
+    tiering.move_to_archive(db, pks, now)
+    return memory_id
+
+def consolidate(db, pool, summarizer=SUMMARIZER, min_age_days=MIN_AGE_DAYS, min_group=MIN_GROUP_SIZE,
+                max_group=MAX_GROUP_SIZE, user_id=None, dry_run=False):
+    # Consolidates one shard; returns (summaries written, memories archived).
+    # Groups are read here, summarized in the pool and written back here, so
+    # the shard only ever has this one extra writer.
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=min_age_days)
+    written = archived = 0
+    batch = []
+
+    def flush():
+        nonlocal written, archived
+        if dry_run:
+            written += len(batch)
+            archived += sum(len(group[2]) for group in batch)
+            return
+        # Release the read snapshot while the workers run
+        db.rollback()
+        futures = [pool.submit(summarize_group, summarizer, [row.content for row in group[2]]) for group in batch]
+        for group, future in zip(batch, futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                logger.error(f"Summarizer failed for {len(group[2])} memories of user pk {group[0]}: {e}")
+                continue
+            if not isinstance(summary, str) or not summary.strip():
+                logger.warning(f"Summarizer returned no text for {len(group[2])} memories of user pk {group[0]}.")
+                continue
+            if write_summary(db, group, summary, summarizer, now) is None:
+                logger.info(f"Skipped a group of user pk {group[0]}: a memory changed while it was summarized.")
+                continue
+            written += 1
+            archived += len(group[2])
+
+    for user_pk in candidate_users(db, cutoff, user_id):
+        batch.extend(user_groups(db, user_pk, cutoff, min_group, max_group))
+        if len(batch) >= GROUPS_PER_BATCH:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    return written, archived
+
+def main(argv=None):
+    from database import shards
+    from initialize_db import check_schema
+
+    parser = argparse.ArgumentParser(description="Condense old memories into summaries and archive the originals.")
+    parser.add_argument("--min-age-days", type=float, default=MIN_AGE_DAYS, help="Only consolidate memories idle this long")
+    parser.add_argument("--min-group", type=int, default=MIN_GROUP_SIZE, help="Smallest group worth condensing")
+    parser.add_argument("--max-group", type=int, default=MAX_GROUP_SIZE, help="Most memories per summary")
+    parser.add_argument("--summarizer", default=SUMMARIZER, help="module:function producing the condensed text")
+    parser.add_argument("--workers", type=int, help="Summarizer processes (default: CPU count)")
+    parser.add_argument("--user-id", help="Only consolidate this user's memories")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many groups would be condensed")
+    parser.add_argument("--every", type=float, help="Keep running, consolidating every this many seconds")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    if args.min_group < 2 or args.max_group < args.min_group:
+        parser.error("need 2 <= --min-group <= --max-group")
+    try:
+        load_summarizer(args.summarizer)
+    except (ImportError, AttributeError, ValueError) as e:
+        parser.error(f"cannot load summarizer {args.summarizer}: {e}")
+
+    for shard in shards:
+        check_schema(shard.engine)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while True:
+            for shard in shards:
+                db = shard.SessionLocal()
+                try:
+                    written, archived = consolidate(
+                        db, pool, args.summarizer, args.min_age_days, args.min_group, args.max_group,
+                        args.user_id, args.dry_run
+                    )
+                    verb = "would condense" if args.dry_run else "condensed"
+                    logger.info(f"Shard {shard.index}: {verb} {archived} memories into {written} summaries.")
+                finally:
+                    db.close()
+            if not args.every:
+                return
+            time.sleep(args.every)
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,66 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import os
+import zlib
 
-# SQLite database URL
+# SQLite database URL (shard 0; also the only file in unsharded deployments)
 DATABASE_URL = "sqlite:///./mem0_local.db"
 
-# Create the SQLAlchemy engine
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Number of SQLite files users are spread across
+SHARD_COUNT = int(os.environ.get("MEMORIEDEN_SHARDS", "1"))
 
-# Create a configured "Session" class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def shard_url(index):
+    return DATABASE_URL if index == 0 else f"sqlite:///./mem0_local.shard{index}.db"
+
+class Shard:
+    # One SQLite file with its own engine, connection pool and memories_fts
+    def __init__(self, index):
+        self.index = index
+        self.engine = create_engine(
+            shard_url(index), connect_args={"check_same_thread": False}
+        )
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+def jump_hash(key, buckets):
+    # Jump consistent hash (Lamping & Veach): growing from N to N+1 buckets
+    # moves only 1/(N+1) of the keys, which keeps rebalancing cheap
+    key = zlib.crc32(key.encode("utf-8")) | (zlib.adler32(key.encode("utf-8")) << 32)
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+def shard_index(user_id, count=SHARD_COUNT):
+    # Memories without a user live on shard 0
+    if not user_id or count == 1:
+        return 0
+    return jump_hash(user_id, count)
+
+shards = [Shard(i) for i in range(SHARD_COUNT)]
+
+def shard_for(user_id):
+    return shards[shard_index(user_id)]
+
+# Shard 0, for code that predates sharding
+engine = shards[0].engine
+SessionLocal = shards[0].SessionLocal
+
+# Worker pool for cross-shard fan-out
+shard_pool = ThreadPoolExecutor(max_workers=max(SHARD_COUNT, 1), thread_name_prefix="memorieden-shard")
+
+def map_shards(func, targets=None):
+    # Runs func(shard) on every shard in parallel and returns results in shard order
+    targets = shards if targets is None else targets
+    if len(targets) == 1:
+        return [func(targets[0])]
+    # Each task gets its own copy of the context so request-scoped state is visible
+    futures = [shard_pool.submit(contextvars.copy_context().run, func, shard) for shard in targets]
+    return [future.result() for future in futures]
 
 # Base class for declarative models
 Base = declarative_base()
@@ -0,0 +1,170 @@
+# dedup.py
+from models import Memory, MemorySignature, MemoryBucket
+from array import array
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+
+logger = logging.getLogger(__name__)
+
+# What add_memory and the bulk path do with a near-duplicate:
+#   off    - no signatures, no checks
+#   reject - refuse the new memory
+#   merge  - rewrite the existing memory with the new wording (recorded in History)
+#   tag    - store the new memory in the existing memory's cluster
+DEDUP_POLICIES = ("off", "reject", "merge", "tag")
+DEFAULT_POLICY = os.environ.get("MEMORIEDEN_DEDUP", "off")
+
+# Estimated Jaccard similarity at which two memories count as near-duplicates
+SIMILARITY_THRESHOLD = float(os.environ.get("MEMORIEDEN_DEDUP_THRESHOLD", "0.8"))
+
+# MinHash over character shingles, split into LSH bands. With 16 bands of 4
+# rows a pair at similarity 0.8 becomes a candidate with probability ~0.9998,
+# at 0.3 with ~0.12; candidates are then checked against the full signature.
+SHINGLE_SIZE = 4
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+
+def _permutations():
+    # Fixed seeds: signatures must be comparable across processes and restarts
+    perms = []
+    for i in range(NUM_PERM):
+        digest = hashlib.blake2b(f"memorieden-minhash-{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], "little") % (_PRIME - 1) + 1
+        b = int.from_bytes(digest[8:], "little") % _PRIME
+        perms.append((a, b))
+    return perms
+
+PERMUTATIONS = _permutations()
+
+def shingles(content):
+    normalized = " ".join(re.findall(r'\w+', content.lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+def signature(content):
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little")
+        for s in shingles(content)
+    ]
+    return [min((a * h + b) % _PRIME for h in hashes) & _MASK for a, b in PERMUTATIONS]
+
+def similarity(sig_a, sig_b):
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / NUM_PERM
+
+def band_buckets(sig):
+    # One signed 64-bit bucket per band, salted with the band index
+    buckets = []
+    for band in range(BANDS):
+        values = array("I", sig[band * ROWS:(band + 1) * ROWS]).tobytes()
+        digest = hashlib.blake2b(band.to_bytes(2, "little") + values, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+def pack(sig):
+    return array("I", sig).tobytes()
+
+def unpack(blob):
+    return array("I", blob).tolist()
+
+def check_policy(policy):
+    if policy not in DEDUP_POLICIES:
+        raise ValueError(f"dedup must be one of {', '.join(DEDUP_POLICIES)}")
+    return policy
+
+def find_duplicate(db, sig, user_pk):
+    # Returns (memory, cluster_id, similarity) for the closest near-duplicate
+    # among the same user's memories, or None
+    candidates = (
+        db.query(MemorySignature.memory_id, MemorySignature.signature, MemorySignature.cluster_id)
+        .join(MemoryBucket, MemoryBucket.memory_id == MemorySignature.memory_id)
+        .join(Memory, Memory.id == MemorySignature.memory_id)
+        .filter(MemoryBucket.bucket.in_(band_buckets(sig)))
+        .filter(Memory.user_id == user_pk if user_pk is not None else Memory.user_id.is_(None))
+        .distinct()
+        .all()
+    )
+
+    best = None
+    for memory_pk, blob, cluster_id in candidates:
+        score = similarity(sig, unpack(blob))
+        if score >= SIMILARITY_THRESHOLD and (best is None or score > best[2]):
+            best = (memory_pk, cluster_id, score)
+    if best is None:
+        return None
+    return db.get(Memory, best[0]), best[1], best[2]
+
+def store_signature(db, memory, sig, cluster_id=None):
+    # memory must be flushed so that memory.id is set
+    db.add(MemorySignature(memory_id=memory.id, signature=pack(sig), cluster_id=cluster_id or memory.memory_id))
+    db.add_all([MemoryBucket(memory_id=memory.id, bucket=bucket) for bucket in band_buckets(sig)])
+
+def refresh_signature(db, memory):
+    # Keeps an existing signature in step with edited content; memories that
+    # were stored without one are left alone
+    existing = db.get(MemorySignature, memory.id)
+    if existing is None:
+        return
+    sig = signature(memory.content)
+    existing.signature = pack(sig)
+    db.query(MemoryBucket).filter(MemoryBucket.memory_id == memory.id).delete(synchronize_session=False)
+    db.add_all([MemoryBucket(memory_id=memory.id, bucket=bucket) for bucket in band_buckets(sig)])
+
+def cluster_ids(db, memory_pks):
+    # memory pk -> cluster id; memories without a signature are their own cluster
+    rows = db.query(MemorySignature.memory_id, MemorySignature.cluster_id).filter(MemorySignature.memory_id.in_(memory_pks))
+    return dict(rows)
+
+def backfill(db, batch_size=1000):
+    # Signs memories stored while dedup was off, oldest first, so each one
+    # joins the cluster of an earlier near-duplicate if there is one
+    signed = 0
+    last_id = 0
+    while True:
+        memories = (
+            db.query(Memory)
+            .outerjoin(MemorySignature, MemorySignature.memory_id == Memory.id)
+            .filter(MemorySignature.memory_id.is_(None), Memory.id > last_id)
+            .order_by(Memory.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not memories:
+            return signed
+        for memory in memories:
+            sig = signature(memory.content)
+            match = find_duplicate(db, sig, memory.user_id)
+            store_signature(db, memory, sig, cluster_id=match[1] if match else None)
+            db.flush()
+            signed += 1
+        last_id = memories[-1].id
+        db.commit()
+
+def main(argv=None):
+    from database import shards
+    from initialize_db import check_schema
+
+    parser = argparse.ArgumentParser(description="Near-duplicate signature maintenance.")
+    parser.add_argument("command", choices=["backfill"], help="Sign memories that have no signature yet")
+    parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    for shard in shards:
+        check_schema(shard.engine)
+    for shard in shards:
+        db = shard.SessionLocal()
+        try:
+            logger.info(f"Shard {shard.index}: signed {backfill(db)} memories.")
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# fts.py
+from models import FtsIndex, Memory
+from sqlalchemy import bindparam, func, text
+import argparse
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Tokenizer name -> (FTS5 table, tokenize argument). porter is the original
+# English-only index; unicode61 folds case and diacritics for any script;
+# trigram matches substrings, which also works for CJK text without spaces.
+TOKENIZERS = {
+    "porter": ("memories_fts", "porter"),
+    "unicode61": ("memories_fts_unicode61", "unicode61 remove_diacritics 2"),
+    "trigram": ("memories_fts_trigram", "trigram"),
+}
+
+# Index searched for users without their own setting
+DEFAULT_TOKENIZER = os.environ.get("MEMORIEDEN_TOKENIZER", "porter")
+
+# Memories copied per transaction by the online reindex
+REINDEX_BATCH_SIZE = 2000
+
+# Every registered index (row in fts_indexes) is kept current on writes, so
+# one memory is stored once per index. An index being built is written to as
+# well; rows up to its backfill_until mark are copied in by reindex().
+
+def check_tokenizer(name):
+    if name not in TOKENIZERS:
+        raise ValueError(f"tokenizer must be one of {', '.join(TOKENIZERS)}")
+    return name
+
+def table_for(tokenizer):
+    return TOKENIZERS[tokenizer][0]
+
+def create_table(conn, tokenizer):
+    table, tokenize = TOKENIZERS[tokenizer]
+    conn.execute(text(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table}
+        USING fts5(content, memory_id, tokenize='{tokenize}');
+    """))
+
+def write_indexes(db):
+    # (table, backfill floor) per registered index. Read it after the
+    # memories themselves are written, inside the same transaction, so an
+    # index registered concurrently is either seen here or backfills them.
+    return [
+        (table_for(tokenizer), backfill_until if status == "building" else 0)
+        for tokenizer, status, backfill_until in db.query(FtsIndex.tokenizer, FtsIndex.status, FtsIndex.backfill_until)
+    ]
+
+def insert_rows(db, rows):
+    # rows: [{"content": ..., "memory_id": ...}] for memories added in this transaction
+    db.flush()
+    for table, _ in write_indexes(db):
+        # One executemany for a whole batch instead of a statement per memory
+        db.execute(text(f"INSERT INTO {table} (content, memory_id) VALUES (:content, :memory_id)"), rows)
+
+def insert_ranges(db, ranges):
+    # Indexes memories by primary key ranges [(first_id, last_id)], e.g. after
+    # an import. Rows under a building index's mark are left to its backfill.
+    for table, floor in write_indexes(db):
+        db.execute(text(f"""
+            INSERT INTO {table} (content, memory_id)
+            SELECT content, memory_id FROM memories
+            WHERE id BETWEEN :first_id AND :last_id AND id > :floor
+        """), [{"first_id": first, "last_id": last, "floor": floor} for first, last in ranges])
+
+def update_content(db, memory_id, content):
+    for table, _ in write_indexes(db):
+        db.execute(text(f"UPDATE {table} SET content = :content WHERE memory_id = :memory_id"),
+                   {"content": content, "memory_id": memory_id})
+
+def delete_memory(db, memory_id):
+    for table, _ in write_indexes(db):
+        db.execute(text(f"DELETE FROM {table} WHERE memory_id = :memory_id"), {"memory_id": memory_id})
+
+def delete_memories(db, memory_pks):
+    # By memories.id, before the memories themselves are deleted
+    for table, _ in write_indexes(db):
+        db.execute(text(f"""
+            DELETE FROM {table} WHERE memory_id IN (
+                SELECT memory_id FROM memories WHERE id IN :pks
+            )
+        """).bindparams(bindparam("pks", expanding=True)), {"pks": list(memory_pks)})
+
+def delete_user_memories(db, user_pks):
+    # memory_id is not indexed in the FTS tables, so clear all of the users' rows in one pass each
+    pks = ",".join(str(int(pk)) for pk in user_pks)
+    for table, _ in write_indexes(db):
+        db.execute(text(f"""
+            DELETE FROM {table} WHERE memory_id IN (
+                SELECT memory_id FROM memories WHERE user_id IN ({pks})
+            )
+        """))
+
+def search_table(db, user=None):
+    # The user's tokenizer, else the deployment default, else any finished index
+    ready = {tokenizer for (tokenizer,) in db.query(FtsIndex.tokenizer).filter(FtsIndex.status == "ready")}
+    for tokenizer in (user.tokenizer if user else None, DEFAULT_TOKENIZER, "porter", *sorted(ready)):
+        if tokenizer in ready:
+            return table_for(tokenizer)
+    return None
+
+def reindex(db, tokenizer, batch_size=REINDEX_BATCH_SIZE):
+    # Builds (or resumes building) one index while the server keeps writing.
+    # Each batch is its own short transaction, so writers wait at most one batch.
+    table = table_for(tokenizer)
+    create_table(db, tokenizer)
+    db.commit()
+
+    index = db.get(FtsIndex, tokenizer)
+    if index is not None and index.status == "ready":
+        return 0
+    if index is None:
+        # Registering takes the write lock, so the mark taken next covers
+        # every memory committed before writers started dual-writing
+        index = FtsIndex(tokenizer=tokenizer, status="building", backfilled_to=0)
+        db.add(index)
+        db.flush()
+        index.backfill_until = db.query(func.max(Memory.id)).scalar() or 0
+        db.commit()
+
+    copied = 0
+    while index.backfilled_to < index.backfill_until:
+        end = min(index.backfilled_to + batch_size, index.backfill_until)
+        result = db.execute(text(f"""
+            INSERT INTO {table} (content, memory_id)
+            SELECT content, memory_id FROM memories WHERE id > :start AND id <= :end
+        """), {"start": index.backfilled_to, "end": end})
+        index.backfilled_to = end
+        db.commit()
+        copied += result.rowcount
+
+    index.status = "ready"
+    db.commit()
+    return copied
+
+def drop(db, tokenizer):
+    # Unregister first so writers stop maintaining the table, then drop it
+    index = db.get(FtsIndex, tokenizer)
+    if index is not None:
+        db.delete(index)
+        db.commit()
+    db.execute(text(f"DROP TABLE IF EXISTS {table_for(tokenizer)}"))
+    db.commit()
+
+def main(argv=None):
+    from database import shards
+    from initialize_db import check_schema
+
+    parser = argparse.ArgumentParser(description="Manage the per-tokenizer FTS indexes on every shard.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reindex_parser = subparsers.add_parser("reindex", help="Build an index online, resuming an interrupted build")
+    reindex_parser.add_argument("tokenizer", choices=list(TOKENIZERS))
+    reindex_parser.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE)
+    reindex_parser.add_argument("--rebuild", action="store_true", help="Drop and rebuild an index that is already built")
+
+    drop_parser = subparsers.add_parser("drop", help="Stop maintaining an index and delete it")
+    drop_parser.add_argument("tokenizer", choices=list(TOKENIZERS))
+
+    subparsers.add_parser("status", help="List the indexes on each shard")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    if args.command == "drop" and args.tokenizer == DEFAULT_TOKENIZER:
+        parser.error(f"{args.tokenizer} is the default tokenizer (MEMORIEDEN_TOKENIZER); change the default first.")
+
+    for shard in shards:
+        check_schema(shard.engine)
+        db = shard.SessionLocal()
+        try:
+            if args.command == "reindex":
+                if args.rebuild:
+                    drop(db, args.tokenizer)
+                copied = reindex(db, args.tokenizer, args.batch_size)
+                logger.info(f"Shard {shard.index}: {args.tokenizer} index ready ({copied} memories copied).")
+            elif args.command == "drop":
+                drop(db, args.tokenizer)
+                logger.info(f"Shard {shard.index}: {args.tokenizer} index dropped.")
+            else:
+                for index in db.query(FtsIndex).order_by(FtsIndex.tokenizer):
+                    progress = "" if index.status == "ready" else f" ({index.backfilled_to}/{index.backfill_until})"
+                    logger.info(f"Shard {shard.index}: {index.tokenizer} {index.status}{progress}")
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 # initialize_db.py
-from database import engine, Base
+from database import shards, Base
 from sqlalchemy import event, text
 from sqlalchemy.engine import Engine
+import models  # Registers the tables on Base
+import fts
+import tiering
+import argparse
 import logging
+import sys
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @event.listens_for(Engine, "connect")
@@ -15,20 +18,132 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor.execute("PRAGMA foreign_keys=ON")
     cursor.close()
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database initialized.")
+# Schema migrations, applied in order by `python initialize_db.py`. The
+# server only checks the recorded version (once per process) and never
+# changes the schema itself. Steps must be safe to re-run on databases
+# created before versioning was introduced.
+
+def create_tables(conn):
+    Base.metadata.create_all(bind=conn)
 
     # Create FTS5 virtual table for memories
+    fts.create_table(conn, "porter")
+
+    # create_all does not add indexes to tables that already exist
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_memories_updated_at ON memories (updated_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_memories_user_id ON memories (user_id)"))
+
+def add_pagination_indexes(conn):
+    # Keyset pagination of /memories/all, newest first, overall and per user
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_memories_created_at ON memories (created_at, memory_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_memories_user_created_at ON memories (user_id, created_at, memory_id)"))
+
+def add_column(conn, table, column, ddl):
+    # create_all already made the column on databases created after it was added
+    columns = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def add_tokenizer_settings(conn):
+    # Registers the original porter index; other tokenizers are built with `python fts.py reindex`
+    models.FtsIndex.__table__.create(bind=conn, checkfirst=True)
+    add_column(conn, "users", "tokenizer", "VARCHAR")
+    conn.execute(text("INSERT OR IGNORE INTO fts_indexes (tokenizer, status) VALUES ('porter', 'ready')"))
+
+def add_tiering(conn):
+    # Access counters and importance on memories, plus the cold tier
+    add_column(conn, "memories", "access_count", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "memories", "last_accessed_at", "DATETIME")
+    add_column(conn, "memories", "importance", "FLOAT NOT NULL DEFAULT 1.0")
+    Base.metadata.create_all(bind=conn, tables=[models.ArchivedMemory.__table__, models.ArchivedHistory.__table__])
+    tiering.create_cold_index(conn)
+
+def add_history_index(conn):
+    # History by memory, for /memories/history and duplicate checks on import
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_history_memory_id ON history (memory_id)"))
+
+MIGRATIONS = [
+    (1, "Create tables, FTS index and lookup indexes", create_tables),
+    (2, "Add pagination indexes", add_pagination_indexes),
+    (3, "Add per-tokenizer FTS index registry and user tokenizer setting", add_tokenizer_settings),
+    (4, "Add access tracking, importance and the cold tier", add_tiering),
+    (5, "Add history lookup index", add_history_index),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+class SchemaError(RuntimeError):
+    pass
+
+def schema_version(conn):
+    # 0 for a database that has never been migrated
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    )).first()
+    if not exists:
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def migrate(engine):
+    # Applies pending migrations, each in its own transaction; returns how many ran
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        current = schema_version(conn)
+
+    applied = 0
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description) VALUES (:version, :description)"),
+                {"version": version, "description": description}
+            )
+        logger.info(f"{engine.url.database}: applied migration {version} ({description}).")
+        applied += 1
+    return applied
+
+def check_schema(engine):
     with engine.connect() as conn:
-        try:
-            conn.execute(text("""
-                CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts 
-                USING fts5(content, memory_id, tokenize='porter');
-            """))
-            logger.info("FTS5 virtual table 'memories_fts' created.")
-        except Exception as e:
-            logger.error(f"Failed to create FTS5 table: {e}")
+        version = schema_version(conn)
+    if version != SCHEMA_VERSION:
+        raise SchemaError(
+            f"{engine.url.database} is at schema version {version}, expected {SCHEMA_VERSION}. "
+            f"Run `python initialize_db.py` to migrate."
+        )
+
+def init_db():
+    for shard in shards:
+        init_shard(shard.engine)
+
+def init_shard(engine):
+    migrate(engine)
+    logger.info(f"Database initialized ({engine.url.database}, schema version {SCHEMA_VERSION}).")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create or migrate the MemorieDen databases (all shards).")
+    parser.add_argument("--check", action="store_true", help="Only report schema versions; exit 1 if a migration is pending")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    if not args.check:
+        init_db()
+        return 0
+
+    pending = False
+    for shard in shards:
+        with shard.engine.connect() as conn:
+            version = schema_version(conn)
+        pending = pending or version != SCHEMA_VERSION
+        logger.info(f"{shard.engine.url.database}: schema version {version} (expected {SCHEMA_VERSION}).")
+    return 1 if pending else 0
 
 if __name__ == "__main__":
-    init_db()
+    sys.exit(main())
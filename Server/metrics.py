@@ -0,0 +1,335 @@
+# metrics.py
+from flask import g, request, has_request_context
+from sqlalchemy import event, text
+from models import FtsIndex
+import fts
+import tiering
+import collections
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets (seconds) shared by the request and SQL histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements slower than this are counted and logged as slow queries
+SLOW_QUERY_SECONDS = float(os.environ.get("MEMORIEDEN_SLOW_QUERY_SECONDS", "0.1"))
+
+# Store gauges scan every table, so scrapes within this many seconds reuse them
+GAUGE_TTL_SECONDS = float(os.environ.get("MEMORIEDEN_GAUGE_TTL_SECONDS", "60"))
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.request_latency = collections.defaultdict(Histogram)
+        self.request_count = collections.Counter()
+        self.sql_latency = collections.defaultdict(Histogram)
+        self.sql_per_request = collections.defaultdict(lambda: Histogram((1, 2, 5, 10, 25, 50, 100, 250)))
+        self.slow_queries = collections.Counter()
+
+    def observe_request(self, route, method, status, seconds, sql_count):
+        with self.lock:
+            self.request_latency[(route, method)].observe(seconds)
+            self.request_count[(route, method, str(status))] += 1
+            self.sql_per_request[(route,)].observe(sql_count)
+
+    def observe_sql(self, route, seconds, slow):
+        with self.lock:
+            self.sql_latency[(route,)].observe(seconds)
+            if slow:
+                self.slow_queries[(route,)] += 1
+
+registry = MetricsRegistry()
+
+# --- Prometheus text rendering ---
+
+def _labels(names, values):
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _render_histogram(lines, name, help_text, label_names, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for label_values, hist in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(label_names + ('le',), label_values + (bound,))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(label_names + ('le',), label_values + ('+Inf',))} {hist.total}")
+        lines.append(f"{name}_sum{_labels(label_names, label_values)} {hist.sum}")
+        lines.append(f"{name}_count{_labels(label_names, label_values)} {hist.total}")
+
+def _render_counter(lines, name, help_text, label_names, counter):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for label_values, value in sorted(counter.items()):
+        lines.append(f"{name}{_labels(label_names, label_values)} {value}")
+
+def _render_gauges(lines, name, help_text, label_names, values):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} gauge")
+    for label_values, value in values:
+        lines.append(f"{name}{_labels(label_names, label_values)} {value}")
+
+def collect_store_gauges(dbs):
+    # Row counts and FTS index size per shard; cached by store_gauges between scrapes
+    gauges = {"rows": [], "fts_bytes": [], "db_bytes": []}
+    for shard, db in enumerate(dbs):
+        fts_tables = [fts.table_for(tokenizer) for (tokenizer,) in db.query(FtsIndex.tokenizer).order_by(FtsIndex.tokenizer)]
+        fts_tables.append(tiering.COLD_FTS_TABLE)
+        for table in ("users", "memories", "history", "memories_archive", "history_archive", *fts_tables):
+            gauges["rows"].append(((str(shard), table), db.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()))
+
+        for table in fts_tables:
+            # <table>_data holds the FTS5 index b-tree; its blob size is the index size
+            fts_bytes = db.execute(text(f"SELECT COALESCE(SUM(LENGTH(block)), 0) FROM {table}_data")).scalar()
+            gauges["fts_bytes"].append(((str(shard), table), fts_bytes))
+        page_size = db.execute(text("PRAGMA page_size")).scalar()
+        page_count = db.execute(text("PRAGMA page_count")).scalar()
+        gauges["db_bytes"].append(((str(shard),), page_size * page_count))
+    return gauges
+
+class GaugeCache:
+    def __init__(self, ttl=GAUGE_TTL_SECONDS):
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.gauges = None
+        self.collected_at = 0.0
+
+    def get(self, collect):
+        # Concurrent scrapes wait for one collection instead of each scanning
+        with self.lock:
+            now = time.monotonic()
+            if self.gauges is None or now - self.collected_at >= self.ttl:
+                self.gauges = collect()
+                self.collected_at = now
+            return self.gauges
+
+store_gauges = GaugeCache()
+
+def render(gauges=None):
+    lines = []
+    with registry.lock:
+        _render_histogram(lines, "memorieden_request_duration_seconds",
+                          "HTTP request latency by route.", ("route", "method"), registry.request_latency)
+        _render_counter(lines, "memorieden_requests_total",
+                        "HTTP requests by route and status.", ("route", "method", "status"), registry.request_count)
+        _render_histogram(lines, "memorieden_sql_duration_seconds",
+                          "SQL statement latency by route.", ("route",), registry.sql_latency)
+        _render_histogram(lines, "memorieden_sql_statements_per_request",
+                          "SQL statements executed per request.", ("route",), registry.sql_per_request)
+        _render_counter(lines, "memorieden_sql_slow_queries_total",
+                        f"SQL statements slower than {SLOW_QUERY_SECONDS}s.", ("route",), registry.slow_queries)
+
+    if gauges:
+        _render_gauges(lines, "memorieden_table_rows", "Row count per table.", ("shard", "table"), gauges["rows"])
+        _render_gauges(lines, "memorieden_fts_index_bytes", "Size of the FTS5 index data.", ("shard", "index"), gauges["fts_bytes"])
+        _render_gauges(lines, "memorieden_database_bytes", "Size of the SQLite database file.", ("shard",), gauges["db_bytes"])
+
+    _render_gauges(lines, "memorieden_profiling_enabled", "Whether sampled profiling is active.", (),
+                   [((), int(profiler.enabled))])
+    return "\n".join(lines) + "\n"
+
+# --- Sampled profiling ---
+
+# Runtime-toggleable profiler. In "cprofile" mode a random sample of requests
+# runs under cProfile and the stats are merged; in "sample" mode a background
+# thread snapshots every thread's stack at a fixed interval.
+class Profiler:
+    MODES = ("cprofile", "sample")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Serializes configure() calls, which stop and start the sampler
+        self.config_lock = threading.Lock()
+        self.enabled = False
+        self.mode = "cprofile"
+        self.sample_rate = 0.01
+        self.interval = 0.01
+        self.stats = None
+        self.stacks = collections.Counter()
+        self.sampler = None
+        self.stop_event = threading.Event()
+
+    def configure(self, enabled, mode=None, sample_rate=None, interval=None):
+        # Validate everything first, so a rejected change leaves profiling as it was
+        if mode is not None and mode not in self.MODES:
+            raise ValueError(f"mode must be one of {', '.join(self.MODES)}")
+        try:
+            if sample_rate is not None:
+                sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            if interval is not None:
+                interval = max(float(interval), 0.001)
+        except (TypeError, ValueError):
+            raise ValueError("sample_rate and interval must be numbers")
+
+        with self.config_lock:
+            # Join the sampler before taking the lock; it takes the lock per sample
+            self._stop_sampler()
+            with self.lock:
+                if mode is not None:
+                    self.mode = mode
+                if sample_rate is not None:
+                    self.sample_rate = sample_rate
+                if interval is not None:
+                    self.interval = interval
+                self.enabled = bool(enabled)
+                if self.enabled:
+                    self.stats = None
+                    self.stacks.clear()
+                    if self.mode == "sample":
+                        self._start_sampler()
+        logger.info(f"Profiling {'enabled' if self.enabled else 'disabled'} (mode={self.mode}).")
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "interval": self.interval,
+        }
+
+    # cProfile mode
+
+    def start_request(self):
+        if not (self.enabled and self.mode == "cprofile") or random.random() >= self.sample_rate:
+            return None
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return None
+        return prof
+
+    def finish_request(self, prof):
+        prof.disable()
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(prof)
+            else:
+                self.stats.add(prof)
+
+    # Stack sampling mode
+
+    def _start_sampler(self):
+        self.stop_event.clear()
+        self.sampler = threading.Thread(target=self._sample_loop, name="memorieden-sampler", daemon=True)
+        self.sampler.start()
+
+    def _stop_sampler(self):
+        if self.sampler is not None:
+            self.stop_event.set()
+            self.sampler.join()
+            self.sampler = None
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                with self.lock:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def report(self, limit=40):
+        with self.lock:
+            if self.mode == "sample":
+                # Collapsed stack format, ready for flamegraph tooling
+                return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common(limit)) + "\n"
+            if self.stats is None:
+                return "No profiled requests yet.\n"
+            out = io.StringIO()
+            self.stats.stream = out
+            self.stats.sort_stats("cumulative").print_stats(limit)
+            return out.getvalue()
+
+profiler = Profiler()
+
+# --- Wiring ---
+
+def _route_label():
+    # Use the URL rule so that /memories/history/<memory_id> is one series
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return "<unmatched>"
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    slow = elapsed >= SLOW_QUERY_SECONDS
+    if has_request_context():
+        route = _route_label()
+        g.sql_count = g.get("sql_count", 0) + 1
+        g.sql_time = g.get("sql_time", 0.0) + elapsed
+        if slow:
+            g.slow_queries = g.get("slow_queries", 0) + 1
+    else:
+        route = "<background>"
+    registry.observe_sql(route, elapsed, slow)
+    if slow:
+        logger.warning(f"Slow query ({elapsed:.3f}s) on {route}: {statement.strip()[:200]}")
+
+def init_app(app, engines):
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+    @app.before_request
+    def start_timer():
+        g.request_start_time = time.perf_counter()
+        g.profile = profiler.start_request()
+
+    @app.after_request
+    def record_request(response):
+        if g.get("profile") is not None:
+            profiler.finish_request(g.profile)
+            g.profile = None
+        elapsed = time.perf_counter() - g.get("request_start_time", time.perf_counter())
+        sql_count = g.get("sql_count", 0)
+        registry.observe_request(_route_label(), request.method, response.status_code, elapsed, sql_count)
+        response.headers["Server-Timing"] = f"app;dur={elapsed * 1000:.1f}, sql;dur={g.get('sql_time', 0.0) * 1000:.1f}"
+        if g.get("slow_queries"):
+            logger.warning(f"{request.method} {request.path} ran {g.slow_queries} slow "
+                           f"quer{'y' if g.slow_queries == 1 else 'ies'} out of {sql_count} in {elapsed:.3f}s")
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # after_request is skipped on unhandled errors; never leave a profiler running
+        if g.get("profile") is not None:
+            profiler.finish_request(g.profile)
+            g.profile = None
@@ -1,6 +1,6 @@
 # models.py
 from sqlalchemy import (
-    Column, Integer, String, Text, ForeignKey, DateTime, JSON
+    Column, Integer, String, Text, ForeignKey, DateTime, JSON, LargeBinary, Float
 )
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -11,6 +11,7 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(String, unique=True, nullable=False)
     meta = Column(JSON, nullable=True)  # Metadata field
+    tokenizer = Column(String, nullable=True)  # FTS index to search; None uses the deployment default
     created_at = Column(DateTime, default=datetime.utcnow)
     memories = relationship("Memory", back_populates="user")
 
@@ -18,19 +19,74 @@ class Memory(Base):
     __tablename__ = 'memories'
     id = Column(Integer, primary_key=True)
     memory_id = Column(String, unique=True, nullable=False)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
     content = Column(Text, nullable=False)
     meta = Column(JSON, nullable=True)  # Metadata field
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    access_count = Column(Integer, nullable=False, default=0, server_default="0")  # Reads, flushed in batches by tiering.AccessTracker
+    last_accessed_at = Column(DateTime, nullable=True)
+    importance = Column(Float, nullable=False, default=1.0, server_default="1.0")  # Decayed access score as of last_accessed_at (or created_at)
     user = relationship("User", back_populates="memories")
     history = relationship("History", back_populates="memory")
 
 class History(Base):
     __tablename__ = 'history'
     id = Column(Integer, primary_key=True)
-    memory_id = Column(Integer, ForeignKey('memories.id'))
+    memory_id = Column(Integer, ForeignKey('memories.id'), index=True)
     prev_value = Column(Text, nullable=False)
     new_value = Column(Text, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow)
     memory = relationship("Memory", back_populates="history")
+
+class ChangeLog(Base):
+    __tablename__ = 'change_log'
+    __table_args__ = {'sqlite_autoincrement': True}  # Never reuse sequence numbers
+    seq = Column(Integer, primary_key=True)  # Monotonic cursor for consumers
+    op = Column(String, nullable=False)  # add, update, delete, archive, restore or tokenizer
+    memory_id = Column(String, nullable=False)  # External memory id, survives deletes; * for all of the user's
+    user_id = Column(String, nullable=True)  # External user id
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+class MemorySignature(Base):
+    __tablename__ = 'memory_signatures'
+    memory_id = Column(Integer, ForeignKey('memories.id', ondelete='CASCADE'), primary_key=True)
+    signature = Column(LargeBinary, nullable=False)  # Packed MinHash values
+    cluster_id = Column(String, nullable=False)  # memory_id of the first memory in its near-duplicate cluster
+
+class MemoryBucket(Base):
+    __tablename__ = 'memory_buckets'
+    id = Column(Integer, primary_key=True)
+    memory_id = Column(Integer, ForeignKey('memories.id', ondelete='CASCADE'), nullable=False, index=True)
+    bucket = Column(Integer, nullable=False, index=True)  # LSH band hash
+
+class FtsIndex(Base):
+    __tablename__ = 'fts_indexes'
+    tokenizer = Column(String, primary_key=True)  # porter, unicode61 or trigram (see fts.py)
+    status = Column(String, nullable=False)  # building or ready; writes go to both
+    backfill_until = Column(Integer, nullable=True)  # Highest memories.id the build copies in
+    backfilled_to = Column(Integer, nullable=True)  # Build progress, for resuming
+
+class ArchivedMemory(Base):
+    # Cold tier: memories moved out of `memories` by tiering.py, searched only on request
+    __tablename__ = 'memories_archive'
+    id = Column(Integer, primary_key=True)
+    memory_id = Column(String, unique=True, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
+    content = Column(Text, nullable=False)
+    meta = Column(JSON, nullable=True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    access_count = Column(Integer, nullable=False, default=0)
+    last_accessed_at = Column(DateTime, nullable=True)
+    importance = Column(Float, nullable=False, default=0.0)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    user = relationship("User")
+
+class ArchivedHistory(Base):
+    __tablename__ = 'history_archive'
+    id = Column(Integer, primary_key=True)
+    memory_id = Column(Integer, ForeignKey('memories_archive.id'), index=True)
+    prev_value = Column(Text, nullable=False)
+    new_value = Column(Text, nullable=False)
+    updated_at = Column(DateTime)
@@ -0,0 +1,120 @@
+# rebalance.py
+from database import Shard, shard_index
+from initialize_db import init_shard
+from models import User, Memory, History, FtsIndex
+from transfer import Importer, shard_records
+from sqlalchemy import select
+import fts
+import tiering
+import argparse
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Users moved per source transaction
+MOVE_BATCH_SIZE = 500
+
+# Moves users whose shard changes when going from old_count to new_count
+# shards. Run it with the server stopped, then restart the server with
+# MEMORIEDEN_SHARDS=new_count. Each batch is copied to its target shard before
+# it is deleted from the source, and copies skip memories that already exist,
+# so an interrupted run can simply be repeated.
+
+def move_users(source, targets, users):
+    # users: list of (pk, user_id, target_index) on the source shard
+    src = source.SessionLocal()
+    try:
+        for target_index in sorted({target for _, _, target in users}):
+            dst = targets[target_index].SessionLocal()
+            try:
+                # Moving is not a logical change, so nothing goes to change_log
+                importer = Importer(dst, record_changes=False)
+                counts = {"user": 0, "memory": 0, "history": 0}
+                for _, user_id, target in users:
+                    if target == target_index:
+                        for record in shard_records(src, counts, user_id=user_id):
+                            importer.add(record)
+                importer.finish()
+            finally:
+                dst.close()
+
+        pks = [pk for pk, _, _ in users]
+        memory_pks = select(Memory.id).where(Memory.user_id.in_(pks))
+        fts.delete_user_memories(src, pks)
+        tiering.delete_user_archive(src, pks)
+        src.query(History).filter(History.memory_id.in_(memory_pks)).delete(synchronize_session=False)
+        src.query(Memory).filter(Memory.user_id.in_(pks)).delete(synchronize_session=False)
+        src.query(User).filter(User.id.in_(pks)).delete(synchronize_session=False)
+        src.commit()
+    finally:
+        src.close()
+
+def copy_indexes(sources, targets):
+    # Builds every FTS index registered on a source on each target, before
+    # users move, so moved users keep searching with their own tokenizer
+    tokenizers = set()
+    for shard in sources:
+        db = shard.SessionLocal()
+        try:
+            tokenizers.update(tokenizer for (tokenizer,) in db.query(FtsIndex.tokenizer))
+        finally:
+            db.close()
+
+    for shard in targets:
+        db = shard.SessionLocal()
+        try:
+            for tokenizer in sorted(tokenizers):
+                copied = fts.reindex(db, tokenizer)
+                if copied:
+                    logger.info(f"Shard {shard.index}: built the {tokenizer} index ({copied} memories).")
+        finally:
+            db.close()
+
+def rebalance(old_count, new_count, dry_run=False):
+    shard_list = [Shard(i) for i in range(max(old_count, new_count))]
+    for shard in shard_list:
+        init_shard(shard.engine)
+    if not dry_run:
+        copy_indexes(shard_list[:old_count], shard_list[:new_count])
+
+    moved = 0
+    for source in shard_list:
+        db = source.SessionLocal()
+        try:
+            users = [
+                (pk, user_id, shard_index(user_id, new_count))
+                for pk, user_id in db.query(User.id, User.user_id).order_by(User.id)
+            ]
+        finally:
+            db.close()
+
+        pending = [user for user in users if user[2] != source.index]
+        logger.info(f"Shard {source.index}: {len(pending)} of {len(users)} users move.")
+        moved += len(pending)
+        if dry_run:
+            continue
+
+        for start in range(0, len(pending), MOVE_BATCH_SIZE):
+            move_users(source, shard_list, pending[start:start + MOVE_BATCH_SIZE])
+
+    for shard in shard_list[new_count:]:
+        logger.info(f"Shard {shard.index} ({shard.engine.url.database}) is no longer used and can be removed.")
+    return moved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move users between shard files after changing MEMORIEDEN_SHARDS.")
+    parser.add_argument("--from-shards", type=int, required=True, help="Current shard count")
+    parser.add_argument("--to-shards", type=int, required=True, help="New shard count")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many users would move")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    if args.from_shards < 1 or args.to_shards < 1:
+        parser.error("Shard counts must be at least 1.")
+
+    moved = rebalance(args.from_shards, args.to_shards, dry_run=args.dry_run)
+    logger.info(f"{'Would move' if args.dry_run else 'Moved'} {moved} users.")
+
+if __name__ == "__main__":
+    main()
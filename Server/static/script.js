@@ -1,24 +1,297 @@
 let selectedUserId = null;
 const historyModal = new bootstrap.Modal(document.getElementById('historyModal'));
 
+// Every list request fetches one bounded page
+const PAGE_SIZE = 100;
+const SEARCH_LIMIT = 100;
+const SEARCH_DEBOUNCE_MS = 250;
+
+// Rows have a fixed height so the lists can be virtualized; long memories
+// are clamped in the list and shown in full in the edit dialog
+const MEMORY_ROW_HEIGHT = 180;
+const USER_ROW_HEIGHT = 42;
+
+function escapeHtml(text) {
+    return String(text)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+function debounce(fn, wait) {
+    let timer = null;
+    const debounced = (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn(...args), wait);
+    };
+    debounced.cancel = () => clearTimeout(timer);
+    return debounced;
+}
+
+// Renders only the rows in view (plus a few above and below) inside a
+// scrolling viewport, and calls onNearEnd when the user scrolls close to
+// the last loaded row
+class VirtualList {
+    constructor(viewport, rowHeight, renderRow, onNearEnd) {
+        this.viewport = viewport;
+        this.rowHeight = rowHeight;
+        this.renderRow = renderRow;
+        this.onNearEnd = onNearEnd;
+        this.overscan = 5;
+        this.items = [];
+        this.frame = null;
+
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'virtual-spacer';
+        this.rows = document.createElement('div');
+        this.rows.className = 'virtual-rows';
+        this.spacer.appendChild(this.rows);
+        viewport.appendChild(this.spacer);
+
+        viewport.addEventListener('scroll', () => this.scheduleRender(), { passive: true });
+        window.addEventListener('resize', () => this.scheduleRender());
+    }
+
+    setItems(items, scrollToTop = false) {
+        this.items = items;
+        if (scrollToTop) {
+            this.viewport.scrollTop = 0;
+        }
+        this.spacer.style.height = `${items.length * this.rowHeight}px`;
+        this.scheduleRender();
+    }
+
+    scheduleRender() {
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => {
+                this.frame = null;
+                this.render();
+            });
+        }
+    }
+
+    refresh() {
+        this.render();
+    }
+
+    render() {
+        const scrollTop = this.viewport.scrollTop;
+        const height = this.viewport.clientHeight;
+        const first = Math.max(0, Math.floor(scrollTop / this.rowHeight) - this.overscan);
+        const last = Math.min(this.items.length, Math.ceil((scrollTop + height) / this.rowHeight) + this.overscan);
+
+        this.rows.style.transform = `translateY(${first * this.rowHeight}px)`;
+        this.rows.innerHTML = this.items.slice(first, last).map((item, i) => `
+            <div class="virtual-row" style="height: ${this.rowHeight}px">
+                ${this.renderRow(item, first + i)}
+            </div>
+        `).join('');
+
+        if (last >= this.items.length - this.overscan) {
+            this.onNearEnd();
+        }
+    }
+}
+
+// Cursor-paginated listing. reset() aborts the request in flight and starts
+// over from the first page; loadMore() fetches the next page, if any.
+class PagedLoader {
+    constructor(buildUrl, itemsKey, onChange) {
+        this.buildUrl = buildUrl;
+        this.itemsKey = itemsKey;
+        this.onChange = onChange;
+        this.items = [];
+        this.cursor = null;
+        this.done = false;
+        this.loading = false;
+        this.controller = null;
+    }
+
+    reset() {
+        if (this.controller) {
+            this.controller.abort();
+        }
+        this.items = [];
+        this.cursor = null;
+        this.done = false;
+        this.loading = false;
+        this.controller = null;
+        this.onChange(true);
+        return this.loadMore();
+    }
+
+    async loadMore() {
+        if (this.loading || this.done) {
+            return;
+        }
+        const controller = new AbortController();
+        this.controller = controller;
+        this.loading = true;
+        this.onChange(false);
+
+        try {
+            const response = await fetch(this.buildUrl(this.cursor), { signal: controller.signal });
+            const data = await response.json();
+            if (this.controller !== controller) {
+                return;
+            }
+            if (!response.ok) {
+                throw new Error(data.error || response.statusText);
+            }
+            this.items = this.items.concat(data[this.itemsKey]);
+            this.cursor = data.next_cursor || null;
+            this.done = !this.cursor;
+        } catch (error) {
+            if (error.name === 'AbortError') {
+                return;
+            }
+            this.done = true;
+            throw error;
+        } finally {
+            // A reset while this page was in flight has already taken over
+            if (this.controller === controller) {
+                this.loading = false;
+                this.controller = null;
+                this.onChange(false);
+            }
+        }
+    }
+}
+
+// Users
+const userList = new VirtualList(
+    document.getElementById('userList'),
+    USER_ROW_HEIGHT,
+    user => `
+        <a href="#" class="list-group-item list-group-item-action ${user.user_id === selectedUserId ? 'active' : ''}"
+           data-user-id="${escapeHtml(user.user_id)}">
+            ${escapeHtml(user.user_id)}
+        </a>
+    `,
+    () => loadMoreUsers()
+);
+
+const userLoader = new PagedLoader(
+    cursor => {
+        const filter = document.getElementById('userFilter').value.trim();
+        const url = new URL(filter ? '/users/search' : '/users/all', window.location.origin);
+        if (filter) {
+            url.searchParams.append('user_id', filter);
+        }
+        url.searchParams.append('limit', PAGE_SIZE);
+        if (cursor) {
+            url.searchParams.append('cursor', cursor);
+        }
+        return url;
+    },
+    'users',
+    scrollToTop => {
+        userList.setItems(userLoader.items, scrollToTop);
+        document.getElementById('usersStatus').textContent = userLoader.loading
+            ? 'Loading...'
+            : (userLoader.items.length ? '' : 'No users found.');
+    }
+);
+
+// Memories: the full listing pages through /memories/all; a search shows
+// the top matches from /memories/search
+let memoryQuery = '';
+
+const memoryList = new VirtualList(
+    document.getElementById('memoriesList'),
+    MEMORY_ROW_HEIGHT,
+    memory => renderMemory(memory, memoryQuery),
+    () => loadMoreMemories()
+);
+
+const memoryLoader = new PagedLoader(
+    cursor => {
+        const url = new URL(memoryQuery ? '/memories/search' : '/memories/all', window.location.origin);
+        if (memoryQuery) {
+            url.searchParams.append('query', memoryQuery);
+            url.searchParams.append('limit', SEARCH_LIMIT);
+        } else {
+            url.searchParams.append('limit', PAGE_SIZE);
+        }
+        if (selectedUserId) {
+            url.searchParams.append('user_id', selectedUserId);
+        }
+        if (cursor) {
+            url.searchParams.append('cursor', cursor);
+        }
+        return url;
+    },
+    'memories',
+    scrollToTop => {
+        memoryList.setItems(memoryLoader.items, scrollToTop);
+        let status = '';
+        if (memoryLoader.loading) {
+            status = 'Loading...';
+        } else if (!memoryLoader.items.length) {
+            status = 'No memories found.';
+        } else if (memoryQuery) {
+            status = `Top ${memoryLoader.items.length} matches`;
+        } else {
+            status = `${memoryLoader.items.length} memories loaded${memoryLoader.done ? '' : ', scroll for more'}`;
+        }
+        document.getElementById('memoriesStatus').textContent = status;
+    }
+);
+
 // Load users when the page loads
 document.addEventListener('DOMContentLoaded', () => {
     loadUsers();
     loadAllMemories();
+
+    const debouncedSearch = debounce(searchMemories, SEARCH_DEBOUNCE_MS);
+    const searchInput = document.getElementById('searchQuery');
+    searchInput.addEventListener('input', debouncedSearch);
+    searchInput.addEventListener('keydown', event => {
+        if (event.key === 'Enter') {
+            debouncedSearch.cancel();
+            searchMemories();
+        }
+    });
+
+    document.getElementById('userFilter').addEventListener('input', debounce(loadUsers, SEARCH_DEBOUNCE_MS));
+
+    document.getElementById('userList').addEventListener('click', event => {
+        const item = event.target.closest('[data-user-id]');
+        if (item) {
+            event.preventDefault();
+            selectUser(item.dataset.userId);
+        }
+    });
+
+    document.getElementById('memoriesList').addEventListener('click', event => {
+        const button = event.target.closest('[data-action]');
+        if (!button) {
+            return;
+        }
+        const memoryId = button.closest('[data-memory-id]').dataset.memoryId;
+        if (button.dataset.action === 'history') {
+            showHistory(memoryId);
+        } else if (button.dataset.action === 'edit') {
+            editMemory(memoryId);
+        }
+    });
 });
 
 // User Management Functions
 async function loadUsers() {
     try {
-        const response = await fetch('/users/all');
-        const data = await response.json();
-        const userList = document.getElementById('userList');
-        userList.innerHTML = data.users.map(user => `
-            <a href="#" class="list-group-item list-group-item-action ${user.user_id === selectedUserId ? 'active' : ''}"
-               onclick="selectUser('${user.user_id}')">
-                ${user.user_id}
-            </a>
-        `).join('');
+        await userLoader.reset();
+    } catch (error) {
+        console.error('Error loading users:', error);
+        alert('Failed to load users');
+    }
+}
+
+async function loadMoreUsers() {
+    try {
+        await userLoader.loadMore();
     } catch (error) {
         console.error('Error loading users:', error);
         alert('Failed to load users');
@@ -28,7 +301,7 @@ async function loadUsers() {
 async function addUser() {
     const userIdInput = document.getElementById('newUserId');
     const userId = userIdInput.value.trim();
-    
+
     if (!userId) {
         alert('Please enter a user ID');
         return;
@@ -56,15 +329,16 @@ async function addUser() {
 
 function selectUser(userId) {
     selectedUserId = selectedUserId === userId ? null : userId;
-    loadUsers();
-    loadAllMemories();
+    // The loaded users are unchanged; only the highlight moves
+    userList.refresh();
+    reloadMemories();
 }
 
 // Memory Management Functions
 async function addMemory() {
     const content = document.getElementById('memoryContent').value.trim();
     const metadataStr = document.getElementById('memoryMetadata').value.trim();
-    
+
     if (!content) {
         alert('Please enter memory content');
         return;
@@ -94,7 +368,7 @@ async function addMemory() {
         if (response.ok) {
             document.getElementById('memoryContent').value = '';
             document.getElementById('memoryMetadata').value = '';
-            loadAllMemories();
+            reloadMemories();
         } else {
             const error = await response.json();
             alert(error.error || 'Failed to add memory');
@@ -106,23 +380,10 @@ async function addMemory() {
 }
 
 async function searchMemories() {
-    const query = document.getElementById('searchQuery').value.trim();
-    
-    if (!query) {
-        loadAllMemories();
-        return;
-    }
+    memoryQuery = document.getElementById('searchQuery').value.trim();
 
     try {
-        const url = new URL('/memories/search', window.location.origin);
-        url.searchParams.append('query', query);
-        if (selectedUserId) {
-            url.searchParams.append('user_id', selectedUserId);
-        }
-
-        const response = await fetch(url);
-        const data = await response.json();
-        displayMemories(data.memories, query);
+        await memoryLoader.reset();
     } catch (error) {
         console.error('Error searching memories:', error);
         alert('Failed to search memories');
@@ -130,65 +391,63 @@ async function searchMemories() {
 }
 
 async function loadAllMemories() {
-    try {
-        const url = new URL('/memories/all', window.location.origin);
-        if (selectedUserId) {
-            url.searchParams.append('user_id', selectedUserId);
-        }
+    document.getElementById('searchQuery').value = '';
+    await searchMemories();
+}
 
-        const response = await fetch(url);
-        const data = await response.json();
-        displayMemories(data.memories);
+// Reloads the current view (listing or search) from its first page
+async function reloadMemories() {
+    await searchMemories();
+}
+
+async function loadMoreMemories() {
+    try {
+        await memoryLoader.loadMore();
     } catch (error) {
         console.error('Error loading memories:', error);
         alert('Failed to load memories');
     }
 }
 
-function displayMemories(memories, searchQuery = '') {
-    const memoriesList = document.getElementById('memoriesList');
-    
-    if (!memories.length) {
-        memoriesList.innerHTML = '<p class="text-muted">No memories found.</p>';
-        return;
+function renderMemory(memory, searchQuery = '') {
+    let content = escapeHtml(memory.content);
+    if (searchQuery) {
+        // Escape the search query to handle special regex characters
+        const escapedQuery = searchQuery.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+        const regex = new RegExp(`(${escapedQuery})`, 'gi');
+        // Split on the raw text so matches never land inside an HTML entity;
+        // the captured matches are at the odd positions
+        content = memory.content.split(regex).map((part, i) =>
+            i % 2 ? `<span class="search-highlight">${escapeHtml(part)}</span>` : escapeHtml(part)
+        ).join('');
     }
 
-    memoriesList.innerHTML = memories.map(memory => {
-        let content = memory.content;
-        if (searchQuery) {
-            // Escape the search query to handle special regex characters
-            const escapedQuery = searchQuery.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
-            const regex = new RegExp(`(${escapedQuery})`, 'gi');
-            content = content.replace(regex, '<span class="search-highlight">$1</span>');
-        }
-
-        return `
-            <div class="memory-card">
-                <div class="memory-content">${content}</div>
-                ${memory.metadata ? 
-                    `<div class="memory-metadata">Metadata: ${JSON.stringify(memory.metadata)}</div>` : 
-                    ''}
-                ${memory.score !== undefined ? 
-                    `<div class="memory-score">Relevance Score: ${memory.score}</div>` : 
-                    ''}
-                <div class="memory-actions">
-                    <button class="btn btn-sm btn-outline-primary" onclick="showHistory('${memory.memory_id}')">
-                        View History
-                    </button>
-                    <button class="btn btn-sm btn-outline-secondary" onclick="editMemory('${memory.memory_id}')">
-                        Edit
-                    </button>
-                </div>
+    return `
+        <div class="memory-card" data-memory-id="${escapeHtml(memory.memory_id)}">
+            <div class="memory-content">${content}</div>
+            ${memory.metadata ?
+                `<div class="memory-metadata">Metadata: ${escapeHtml(JSON.stringify(memory.metadata))}</div>` :
+                ''}
+            ${memory.score !== undefined ?
+                `<div class="memory-score">Relevance Score: ${memory.score}</div>` :
+                ''}
+            <div class="memory-actions">
+                <button class="btn btn-sm btn-outline-primary" data-action="history">
+                    View History
+                </button>
+                <button class="btn btn-sm btn-outline-secondary" data-action="edit">
+                    Edit
+                </button>
             </div>
-        `;
-    }).join('');
+        </div>
+    `;
 }
 
 async function showHistory(memoryId) {
     try {
-        const response = await fetch(`/memories/history/${memoryId}`);
+        const response = await fetch(`/memories/history/${encodeURIComponent(memoryId)}`);
         const data = await response.json();
-        
+
         const historyContent = document.getElementById('historyContent');
         if (!data.history.length) {
             historyContent.innerHTML = '<p class="text-muted">No history available.</p>';
@@ -196,12 +455,12 @@ async function showHistory(memoryId) {
             historyContent.innerHTML = data.history.map(record => `
                 <div class="history-item">
                     <div class="history-timestamp">${new Date(record.updated_at).toLocaleString()}</div>
-                    <div class="text-danger memory-content">- ${record.prev_value}</div>
-                    <div class="text-success memory-content">+ ${record.new_value}</div>
+                    <div class="text-danger memory-content">- ${escapeHtml(record.prev_value)}</div>
+                    <div class="text-success memory-content">+ ${escapeHtml(record.new_value)}</div>
                 </div>
             `).join('');
         }
-        
+
         historyModal.show();
     } catch (error) {
         console.error('Error loading memory history:', error);
@@ -232,14 +491,14 @@ async function editMemory(memoryId) {
     `;
     document.body.appendChild(dialog);
 
-    const memories = await fetch('/memories/all').then(r => r.json());
-    const memory = memories.memories.find(m => m.memory_id === memoryId);
-    
+    // The memory is on a page that is already loaded
+    const memory = memoryLoader.items.find(m => m.memory_id === memoryId);
+
     const modalElement = document.getElementById('editMemoryModal');
     const modal = new bootstrap.Modal(modalElement);
     const textarea = document.getElementById('editMemoryContent');
     textarea.value = memory?.content || '';
-    
+
     document.getElementById('saveMemoryEdit').onclick = async () => {
         const newContent = textarea.value;
         if (!newContent) return;
@@ -256,7 +515,11 @@ async function editMemory(memoryId) {
 
             if (response.ok) {
                 modal.hide();
-                loadAllMemories();
+                // Patch the loaded row instead of reloading every page
+                if (memory) {
+                    memory.content = newContent;
+                    memoryList.refresh();
+                }
             } else {
                 const error = await response.json();
                 alert(error.error || 'Failed to update memory');
@@ -272,4 +535,4 @@ async function editMemory(memoryId) {
     });
 
     modal.show();
-}
\ No newline at end of file
+}
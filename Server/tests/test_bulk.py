@@ -0,0 +1,65 @@
+# test_bulk.py
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+import app
+from database import shards, shard_index
+from conftest import count
+
+def users_on(index, n):
+    users = (f"user{i}" for i in range(1000))
+    return [user for user in users if shard_index(user) == index][:n]
+
+def batch():
+    # Four memories on each shard
+    return [
+        {"content": f"bulk memory {i}", "user_id": user}
+        for index in range(len(shards))
+        for i, user in enumerate(users_on(index, 4))
+    ]
+
+def locked():
+    return OperationalError("COMMIT", {}, Exception("database is locked"))
+
+def fail_on_last_shard(monkeypatch, name, error):
+    original = getattr(app, name)
+    def wrapper(db, *args):
+        if db.get_bind() is shards[-1].engine:
+            raise error
+        return original(db, *args)
+    monkeypatch.setattr(app, name, wrapper)
+
+def test_bulk_add_spans_shards(client):
+    response = client.post("/memories/add_bulk", json={"memories": batch()})
+    assert response.status_code == 201
+    assert all(result["status"] == "success" for result in response.get_json()["results"])
+    assert count("memories") == count("memories_fts") == count("change_log") == 8
+
+@pytest.mark.parametrize("error, status", [(RuntimeError("fts failure"), 500), (locked(), 503)])
+def test_failure_on_a_later_shard_commits_nothing(client, monkeypatch, error, status):
+    fail_on_last_shard(monkeypatch, "insert_fts_rows", error)
+    response = client.post("/memories/add_bulk", json={"memories": batch()})
+    assert response.status_code == status
+    # A client retrying the whole batch must not duplicate the first shard's memories
+    assert count("memories") == count("change_log") == 0
+
+def test_failed_commit_reports_only_uncommitted_items(client, monkeypatch):
+    commit = Session.commit
+    def flaky_commit(self):
+        if self.get_bind() is shards[-1].engine:
+            raise locked()
+        return commit(self)
+    monkeypatch.setattr(Session, "commit", flaky_commit)
+
+    items = batch()
+    response = client.post("/memories/add_bulk", json={"memories": items})
+    assert response.status_code == 207
+    results = response.get_json()["results"]
+    failed = [item for item, result in zip(items, results) if result["status"] == "failed"]
+    assert [result["status"] for result in results] == ["success"] * 4 + ["failed"] * 4
+    assert count("memories") == 4
+
+    monkeypatch.setattr(Session, "commit", commit)
+    response = client.post("/memories/add_bulk", json={"memories": failed})
+    assert response.status_code == 201
+    assert count("memories") == count("memories_fts") == count("change_log") == 8
@@ -0,0 +1,55 @@
+# test_changes.py
+from database import shards, shard_index
+
+def users_on(index, n):
+    users = (f"user{i}" for i in range(1000))
+    return [user for user in users if shard_index(user) == index][:n]
+
+def add_memories(client, per_shard):
+    # Returns the memory_ids added, per_shard on each shard
+    memory_ids = []
+    for index in range(len(shards)):
+        for user in users_on(index, per_shard):
+            response = client.post("/memories/add", json={"content": f"note for {user}", "user_id": user})
+            memory_ids.append(response.get_json()["memory_id"])
+    return memory_ids
+
+def test_cursor_joins_the_shard_sequences(client):
+    start = client.get("/changes").get_json()
+    assert start == {"changes": [], "cursor": "0.0", "reset": False, "has_more": False}
+
+    memory_ids = add_memories(client, 2)
+    response = client.get("/changes", query_string={"since": start["cursor"]}).get_json()
+    assert sorted(change["memory_id"] for change in response["changes"]) == sorted(memory_ids)
+    assert response["cursor"] == "2.2"
+    assert not response["reset"] and not response["has_more"]
+
+    response = client.get("/changes", query_string={"since": response["cursor"]}).get_json()
+    assert response["changes"] == [] and response["cursor"] == "2.2"
+
+def test_limit_pages_across_shards(client):
+    cursor = client.get("/changes").get_json()["cursor"]
+    memory_ids = add_memories(client, 3)
+
+    pages = []
+    while True:
+        response = client.get("/changes", query_string={"since": cursor, "limit": 4}).get_json()
+        pages.append([change["memory_id"] for change in response["changes"]])
+        cursor = response["cursor"]
+        if not response["has_more"]:
+            break
+    assert [len(page) for page in pages] == [4, 2]
+    assert sorted(memory_id for page in pages for memory_id in page) == sorted(memory_ids)
+    assert cursor == "3.3"
+
+def test_unusable_cursor_resets_to_the_head(client):
+    add_memories(client, 1)
+    head = client.get("/changes").get_json()["cursor"]
+    assert head == "1.1"
+
+    # One shard's part ahead of its sequence, a different shard count, or garbage
+    for since in ("1.99", "1", "1.1.1", "x.1"):
+        response = client.get("/changes", query_string={"since": since}).get_json()
+        assert response == {"changes": [], "cursor": head, "reset": True, "has_more": False}
+
+    assert client.get("/changes", query_string={"limit": "many"}).status_code == 400
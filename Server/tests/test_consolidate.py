@@ -0,0 +1,80 @@
+# test_consolidate.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import consolidate
+import fts
+from database import shard_for
+from models import Memory
+from conftest import count
+
+def add_session(client, user_id, n, session="s1"):
+    for i in range(n):
+        client.post("/memories/add", json={
+            "content": f"{user_id} talked about hiking trail {i}.", "user_id": user_id, "metadata": {"session_id": session}
+        })
+
+def groups(db, user_id):
+    cutoff = datetime.utcnow() + timedelta(seconds=1)
+    user_pks = consolidate.candidate_users(db, cutoff, user_id)
+    return [group for pk in user_pks for group in consolidate.user_groups(db, pk, cutoff)]
+
+def test_extractive_summary_is_deterministic():
+    contents = ["Alice loves hiking. She has a dog.", "alice loves hiking!", "The dog is called Rex."]
+    summary = consolidate.extractive_summary(contents)
+    assert summary == consolidate.extractive_summary(list(contents))
+    assert summary.count("hiking") == 1 and "Rex" in summary
+
+def test_consolidation_replaces_originals_with_a_summary(client):
+    add_session(client, "alice", 6)
+    db = shard_for("alice").SessionLocal()
+    try:
+        with ThreadPoolExecutor(1) as pool:
+            written, archived = consolidate.consolidate(db, pool, min_age_days=-1, user_id="alice")
+        assert (written, archived) == (1, 6)
+        summary = db.query(Memory).one()
+        assert len(summary.meta["consolidated_from"]) == 6 and summary.meta["session_id"] == "s1"
+        # Summaries and originals are not grouped again
+        assert groups(db, "alice") == []
+    finally:
+        db.close()
+    assert count("memories_archive") == 6
+
+def test_restored_originals_are_not_consolidated_again(client):
+    add_session(client, "alice", 6)
+    db = shard_for("alice").SessionLocal()
+    try:
+        with ThreadPoolExecutor(1) as pool:
+            consolidate.consolidate(db, pool, min_age_days=-1, user_id="alice")
+    finally:
+        db.close()
+
+    # Editing archived originals restores them to the hot tier
+    found = client.get("/memories/search", query_string={"query": "hiking", "include_cold": "true"}).get_json()["memories"]
+    for memory in found:
+        if memory.get("tier") == "cold":
+            client.put("/memories/update", json={"memory_id": memory["memory_id"], "new_content": memory["content"] + " Again."})
+    db = shard_for("alice").SessionLocal()
+    try:
+        assert db.query(Memory).count() == 7
+        assert groups(db, "alice") == []
+    finally:
+        db.close()
+
+def test_edit_committed_before_the_write_lock_skips_the_group(client, monkeypatch):
+    add_session(client, "alice", 5)
+    db = shard_for("alice").SessionLocal()
+    try:
+        [group] = groups(db, "alice")
+        edited = group[2][0].memory_id
+
+        # An edit that commits after the group was read but before the summary is written
+        insert_rows = fts.insert_rows
+        def edit_first(*args):
+            client.put("/memories/update", json={"memory_id": edited, "new_content": "changed meanwhile"})
+            return insert_rows(*args)
+        monkeypatch.setattr(fts, "insert_rows", edit_first)
+
+        assert consolidate.write_summary(db, group, "summary", consolidate.SUMMARIZER, datetime.utcnow()) is None
+    finally:
+        db.close()
+    assert count("memories") == 5 and count("memories_archive") == 0
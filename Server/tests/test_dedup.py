@@ -0,0 +1,18 @@
+# test_dedup.py
+import dedup
+
+def test_unknown_policy_is_rejected(client):
+    response = client.post("/memories/add", json={"content": "tea", "user_id": "alice", "dedup": "sometimes"})
+    assert response.status_code == 400
+    response = client.post("/memories/add_bulk", json={"memories": [{"content": "tea"}], "dedup": "sometimes"})
+    assert response.status_code == 400
+
+def test_reject_policy_refuses_near_duplicates(client):
+    first = client.post("/memories/add", json={"content": "Alice likes green tea in the morning", "user_id": "alice", "dedup": "reject"})
+    assert first.status_code == 201
+    second = client.post("/memories/add", json={"content": "Alice likes green tea in the mornings", "user_id": "alice", "dedup": "reject"})
+    assert second.status_code == 409
+    assert second.get_json()["duplicate_of"] == first.get_json()["memory_id"]
+
+def test_signatures_are_deterministic():
+    assert dedup.signature("green tea") == dedup.signature("Green tea!")
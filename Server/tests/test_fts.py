@@ -0,0 +1,42 @@
+# test_fts.py
+from sqlalchemy import text
+from database import shard_for
+from models import Memory
+import fts
+
+def indexed(db, table):
+    return set(db.execute(text(f"SELECT memory_id, content FROM {table}")).all())
+
+def test_online_reindex_keeps_up_with_writes(client):
+    for i in range(10):
+        client.post("/memories/add", json={"content": f"phone number {i}", "user_id": "alice"})
+    listed = client.get("/memories/all", query_string={"user_id": "alice"}).get_json()["memories"]
+    first, second = listed[-1]["memory_id"], listed[-2]["memory_id"]
+
+    # The server keeps writing between the build's transactions
+    writes = iter([
+        lambda: client.post("/memories/add", json={"content": "added before registering", "user_id": "alice"}),
+        lambda: client.post("/memories/add", json={"content": "added while building", "user_id": "alice"}),
+        lambda: client.put("/memories/update", json={"memory_id": first, "new_content": "renumbered phone"}),
+        lambda: client.delete(f"/memories/delete/{second}"),
+    ])
+    db = shard_for("alice").SessionLocal()
+    commit = db.commit
+    def commit_then_write():
+        commit()
+        write = next(writes, None)
+        if write is not None:
+            assert write().status_code < 300
+
+    db.commit = commit_then_write
+    try:
+        assert fts.reindex(db, "trigram", batch_size=3) > 0
+        memories = set(db.query(Memory.memory_id, Memory.content).all())
+        assert indexed(db, "memories_fts_trigram") == indexed(db, "memories_fts") == memories
+        assert len(memories) == 11
+    finally:
+        db.close()
+
+    client.put("/users/update", json={"user_id": "alice", "tokenizer": "trigram"})
+    response = client.get("/memories/search", query_string={"query": "umber", "user_id": "alice", "limit": 50})
+    assert len(response.get_json()["memories"]) == 9
@@ -0,0 +1,39 @@
+# test_metrics.py
+import pytest
+import metrics
+
+@pytest.fixture
+def profiler(client):
+    yield metrics.profiler
+    metrics.profiler.configure(False)
+
+def test_rejected_profiling_change_keeps_the_sampler(client, profiler):
+    response = client.put("/metrics/profiling", json={"enabled": True, "mode": "sample", "interval": 0.01})
+    assert response.status_code == 200
+    sampler = profiler.sampler
+    assert sampler.is_alive()
+
+    for change in ({"mode": "flame"}, {"interval": "often"}, {"sample_rate": [1]}):
+        response = client.put("/metrics/profiling", json={"enabled": True, **change})
+        assert response.status_code == 400
+        assert profiler.sampler is sampler and sampler.is_alive()
+    assert client.get("/metrics/profiling").status_code == 200
+    assert profiler.status() == {"enabled": True, "mode": "sample", "sample_rate": 0.01, "interval": 0.01}
+
+def test_store_gauges_are_cached_between_scrapes(client, monkeypatch):
+    monkeypatch.setattr(metrics, "store_gauges", metrics.GaugeCache(ttl=60))
+    scans = []
+    collect = metrics.collect_store_gauges
+    monkeypatch.setattr(metrics, "collect_store_gauges", lambda dbs: scans.append(1) or collect(dbs))
+
+    client.post("/memories/add", json={"content": "counted once"})
+    first = client.get("/metrics").get_data(as_text=True)
+    client.post("/memories/add", json={"content": "counted later"})
+    second = client.get("/metrics").get_data(as_text=True)
+    assert len(scans) == 1
+    assert 'memorieden_table_rows{shard="0",table="memories"}' in first
+    assert first.split("memorieden_table_rows", 1)[1] == second.split("memorieden_table_rows", 1)[1]
+
+    metrics.store_gauges.ttl = 0
+    client.get("/metrics")
+    assert len(scans) == 2
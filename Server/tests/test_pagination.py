@@ -0,0 +1,62 @@
+# test_pagination.py
+import gzip
+import io
+import json
+import app
+import transfer
+
+def import_memories(records):
+    header = {"type": "header", "format": transfer.FORMAT_NAME, "version": transfer.FORMAT_VERSION}
+    lines = [json.dumps(record) for record in [header, *records]]
+    transfer.import_stream(io.BytesIO(gzip.compress("\n".join(lines).encode("utf-8"))))
+
+def walk(client, path, key, **params):
+    # Every item of a paginated listing, following next_cursor
+    items, cursor = [], None
+    while True:
+        query = {**params, **({"cursor": cursor} if cursor else {})}
+        response = client.get(path, query_string=query)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert len(body[key]) <= params["limit"]
+        items.extend(body[key])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+
+def test_memories_page_newest_first_across_shards(client):
+    # Three memories share each timestamp, so pages also split ties
+    import_memories([
+        {"type": "memory", "memory_id": f"mem_{i:08x}", "user": f"user{i % 4}", "content": f"fact {i}",
+         "created_at": f"2026-01-0{1 + i // 3}T00:00:00"}
+        for i in range(11)
+    ])
+
+    memories = walk(client, "/memories/all", "memories", limit=2)
+    keys = [(mem["created_at"], mem["memory_id"]) for mem in memories]
+    assert keys == sorted(keys, reverse=True)
+    assert len(set(keys)) == 11
+
+    everything = client.get("/memories/all").get_json()["memories"]
+    assert sorted(mem["memory_id"] for mem in everything) == sorted(mem["memory_id"] for mem in memories)
+
+    user_memories = walk(client, "/memories/all", "memories", limit=1, user_id="user1")
+    assert [mem["content"] for mem in user_memories] == ["fact 9", "fact 5", "fact 1"]
+
+def test_users_page_in_user_id_order(client):
+    for i in range(7):
+        client.post("/users/add", json={"user_id": f"user{i}"})
+    client.post("/users/add", json={"user_id": "admin"})
+
+    users = walk(client, "/users/all", "users", limit=3)
+    assert [user["user_id"] for user in users] == ["admin"] + [f"user{i}" for i in range(7)]
+
+    users = walk(client, "/users/search", "users", limit=2, user_id="user")
+    assert [user["user_id"] for user in users] == [f"user{i}" for i in range(7)]
+
+def test_bad_page_arguments_are_rejected(client):
+    assert client.get("/memories/all", query_string={"limit": 5, "cursor": "not a cursor"}).status_code == 400
+    # A cursor needs a limit, and must hold the listing's own sort key
+    assert client.get("/memories/all", query_string={"cursor": app.encode_cursor("user0")}).status_code == 400
+    assert client.get("/memories/all", query_string={"limit": 5, "cursor": app.encode_cursor("user0")}).status_code == 400
+    assert client.get("/users/all", query_string={"limit": "ten"}).status_code == 400
@@ -0,0 +1,42 @@
+# test_rebalance.py
+from sqlalchemy import text
+from database import Shard, shards, shard_index
+from models import User
+import fts
+import rebalance
+import transfer
+
+def test_moved_users_keep_their_tokenizer(store):
+    # A one-shard store whose users search with trigram
+    users = [f"user{i}" for i in range(12)]
+    db = shards[0].SessionLocal()
+    try:
+        importer = transfer.Importer(db)
+        for user in users:
+            importer.add({"type": "user", "user_id": user, "tokenizer": "trigram"})
+            for i in range(3):
+                importer.add({"type": "memory", "memory_id": f"mem_{user}_{i}", "user": user, "content": f"phone number {i}"})
+        importer.finish()
+        fts.reindex(db, "trigram")
+    finally:
+        db.close()
+
+    assert rebalance.rebalance(1, 3) > 0
+    targets = [Shard(i) for i in range(3)]
+    try:
+        for user in users:
+            db = targets[shard_index(user, 3)].SessionLocal()
+            try:
+                record = db.query(User).filter_by(user_id=user).one()
+                table = fts.search_table(db, record)
+                assert table == "memories_fts_trigram"
+                hits = db.execute(text(f"""
+                    SELECT COUNT(*) FROM {table} f JOIN memories m ON m.memory_id = f.memory_id
+                    WHERE {table} MATCH 'umber' AND m.user_id = :pk
+                """), {"pk": record.id}).scalar()
+                assert hits == 3
+            finally:
+                db.close()
+    finally:
+        for shard in targets:
+            shard.engine.dispose()
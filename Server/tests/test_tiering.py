@@ -0,0 +1,108 @@
+# test_tiering.py
+import glob
+import sqlite3
+from datetime import datetime, timedelta
+import rebalance
+import tiering
+from database import shards
+from models import Memory
+from conftest import count
+
+def add_memories(client, n):
+    return [
+        client.post("/memories/add", json={"content": f"hiking trip {i}", "user_id": f"user{i}"}).get_json()["memory_id"]
+        for i in range(n)
+    ]
+
+def archive_all():
+    for shard in shards:
+        db = shard.SessionLocal()
+        try:
+            tiering.archive(db, threshold=100, min_age_days=0)
+        finally:
+            db.close()
+
+def file_count(table):
+    # Across every shard file, including ones created by a rebalance
+    total = 0
+    for path in glob.glob("mem0_local*.db"):
+        with sqlite3.connect(path) as conn:
+            total += conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return total
+
+def search(client, query, **params):
+    return client.get("/memories/search", query_string={"query": query, **params}).get_json()["memories"]
+
+def test_archived_memories_leave_default_search(client):
+    memory_ids = add_memories(client, 6)
+    client.put("/memories/update", json={"memory_id": memory_ids[0], "new_content": "hiking trip zero"})
+    archive_all()
+
+    assert search(client, "hiking") == []
+    cold = search(client, "hiking", include_cold="true")
+    assert len(cold) == 6 and all(memory["tier"] == "cold" for memory in cold)
+    assert len(client.get(f"/memories/history/{memory_ids[0]}").get_json()["history"]) == 1
+
+    # Updating an archived memory brings it back to the hot tier
+    client.put("/memories/update", json={"memory_id": memory_ids[0], "new_content": "hiking trip again"})
+    assert [memory["memory_id"] for memory in search(client, "hiking")] == [memory_ids[0]]
+    assert count("memories_archive") == 5
+
+def test_rebalance_keeps_cold_memories_cold(client):
+    memory_ids = add_memories(client, 12)
+    client.put("/memories/update", json={"memory_id": memory_ids[1], "new_content": "hiking trip one"})
+    archive_all()
+
+    assert rebalance.rebalance(len(shards), len(shards) + 1) > 0
+
+    assert file_count("memories") == 0
+    assert file_count("memories_archive") == file_count("memories_cold_fts") == 12
+    assert file_count("history") == 0
+    assert file_count("history_archive") == 1
+
+def locate(memory_id):
+    # (shard, pk) of a hot memory
+    for shard in shards:
+        db = shard.SessionLocal()
+        try:
+            pk = db.query(Memory.id).filter_by(memory_id=memory_id).scalar()
+        finally:
+            db.close()
+        if pk is not None:
+            return shard, pk
+    return None, None
+
+def test_access_flushes_from_several_trackers_add_up(client):
+    shard, pk = locate(add_memories(client, 1)[0])
+
+    # The trackers of two worker processes flushing the same memory
+    first, second = tiering.AccessTracker(), tiering.AccessTracker()
+    first.record(shard, [pk, pk])
+    second.record(shard, [pk])
+    first.flush()
+    second.flush()
+
+    db = shard.SessionLocal()
+    try:
+        memory = db.get(Memory, pk)
+        assert memory.access_count == 3
+        assert abs(memory.importance - 4.0) < 0.01
+    finally:
+        db.close()
+
+def test_archive_move_skips_memories_read_since_the_scan(client):
+    shard, read_pk = locate(add_memories(client, 1)[0])
+    db = shard.SessionLocal()
+    try:
+        for i in range(3):
+            db.add(Memory(memory_id=f"mem_idle{i}", content=f"idle {i}"))
+        db.commit()
+        pks = [pk for (pk,) in db.query(Memory.id)]
+
+        cutoff = datetime.utcnow()
+        tiering.apply_accesses(db, {read_pk: 1}, cutoff + timedelta(seconds=1))
+
+        assert tiering.move_to_archive(db, pks, cutoff, cutoff=cutoff) == len(pks) - 1
+        assert db.query(Memory.id).all() == [(read_pk,)]
+    finally:
+        db.close()
@@ -0,0 +1,85 @@
+# test_transfer.py
+import gzip
+import io
+import json
+import pytest
+import transfer
+from conftest import count
+
+def export_stream(records):
+    header = {"type": "header", "format": transfer.FORMAT_NAME, "version": transfer.FORMAT_VERSION}
+    lines = [json.dumps(record) for record in [header, *records]]
+    return io.BytesIO(gzip.compress("\n".join(lines).encode("utf-8")))
+
+def memory_records(n):
+    return [
+        {"type": "memory", "memory_id": f"mem_{i:08x}", "user": f"user{i % 4}", "content": f"imported fact {i}"}
+        for i in range(n)
+    ]
+
+def test_failed_import_keeps_committed_batches_indexed(client):
+    # Batches committed before the bad record must be searchable and published
+    with pytest.raises(ValueError):
+        transfer.import_stream(export_stream(memory_records(30) + [{"type": "bogus"}]), batch_size=5)
+
+    imported = count("memories")
+    assert imported > 0
+    assert count("memories_fts") == imported
+    assert count("change_log") == imported
+
+    counts = transfer.import_stream(export_stream(memory_records(30)), batch_size=5)
+    assert counts["memory"] + counts["skipped"] == 30
+    assert count("memories") == count("memories_fts") == count("change_log") == 30
+
+    response = client.get("/memories/search", query_string={"query": "imported", "limit": 100})
+    assert len(response.get_json()["memories"]) == 30
+
+def history_records(n):
+    return [
+        {"type": "history", "memory_id": f"mem_{i:08x}", "prev_value": f"imported fact {i}",
+         "new_value": f"imported fact {i}", "updated_at": "2026-01-01T00:00:00"}
+        for i in range(n)
+    ]
+
+def test_rerun_after_interruption_imports_the_history(client):
+    records = memory_records(4) + history_records(4)
+    # The memories batch commits; the history still buffered is rolled back
+    with pytest.raises(ValueError):
+        transfer.import_stream(export_stream(records[:6] + [{"type": "bogus"}]), batch_size=4)
+    assert count("memories") == 4
+    assert count("history") == 0
+
+    counts = transfer.import_stream(export_stream(records), batch_size=4)
+    assert counts == {"user": 0, "memory": 0, "history": 4, "skipped": 4}
+    assert count("history") == 4
+
+    # Running it once more adds nothing
+    counts = transfer.import_stream(export_stream(records), batch_size=4)
+    assert counts == {"user": 0, "memory": 0, "history": 0, "skipped": 4}
+    assert count("history") == 4
+
+@pytest.mark.parametrize("record", [
+    {"type": "memory", "memory_id": "mem_00000000", "content": None},
+    {"type": "memory", "content": "no id"},
+    {"type": "history", "memory_id": "mem_00000000", "prev_value": None, "new_value": "x"},
+])
+def test_incomplete_records_are_rejected(client, record):
+    with pytest.raises((ValueError, KeyError)):
+        transfer.import_stream(export_stream(memory_records(1) + [record]))
+    assert count("memories") == count("history") == 0
+
+def test_export_import_round_trip(client, tmp_path):
+    for i in range(12):
+        client.post("/memories/add", json={"content": f"round trip {i}", "user_id": f"user{i % 3}"})
+    data = b"".join(transfer.export_chunks(transfer.export_store()))
+
+    counts = transfer.import_stream(io.BytesIO(data))
+    assert counts == {"user": 0, "memory": 0, "history": 0, "skipped": 12}
+
+def test_broken_gzip_upload_is_rejected(client):
+    data = export_stream(memory_records(50)).getvalue()
+    corrupt = data[:40] + bytes(b ^ 0xFF for b in data[40:60]) + data[60:]
+    for body in (data[:len(data) // 2], corrupt):
+        response = client.post("/import", data=body, content_type="application/gzip")
+        assert response.status_code == 400
+        assert "Invalid export stream" in response.get_json()["error"]
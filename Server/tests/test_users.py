@@ -0,0 +1,20 @@
+# test_users.py
+from conftest import count
+
+def test_unknown_tokenizer_is_rejected(client):
+    assert client.post("/users/add", json={"user_id": "alice", "tokenizer": "klingon"}).status_code == 400
+    client.post("/users/add", json={"user_id": "alice"})
+    assert client.put("/users/update", json={"user_id": "alice", "tokenizer": "klingon"}).status_code == 400
+
+def test_tokenizer_change_is_published(client):
+    client.post("/users/add", json={"user_id": "alice"})
+    cursor = client.get("/changes").get_json()["cursor"]
+
+    response = client.put("/users/update", json={"user_id": "alice", "tokenizer": "unicode61"})
+    assert response.get_json()["tokenizer"] == "unicode61"
+    changes = client.get("/changes", query_string={"since": cursor}).get_json()["changes"]
+    assert [(change["op"], change["memory_id"], change["user"]) for change in changes] == [("tokenizer", "*", "alice")]
+
+    # Metadata and an unchanged tokenizer do not affect search results
+    client.put("/users/update", json={"user_id": "alice", "tokenizer": "unicode61", "metadata": {"plan": "pro"}})
+    assert count("change_log", "WHERE op = 'tokenizer'") == 1
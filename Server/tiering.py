@@ -0,0 +1,332 @@
+# tiering.py
+from models import User, Memory, History, ArchivedMemory, ArchivedHistory
+from changefeed import record_change, record_changes
+from sqlalchemy import DateTime, bindparam, event, insert, literal, or_, select, text
+from sqlalchemy.engine import Engine
+from datetime import datetime, timedelta
+import argparse
+import atexit
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import fts
+
+logger = logging.getLogger(__name__)
+
+# A memory's importance is a decayed access count: it starts at 1.0, gains
+# 1.0 per read and halves every HALF_LIFE_DAYS without reads.
+HALF_LIFE_DAYS = float(os.environ.get("MEMORIEDEN_IMPORTANCE_HALF_LIFE_DAYS", "14"))
+
+# Memories below COLD_THRESHOLD that have not been read or edited for
+# COLD_MIN_AGE_DAYS are moved to the cold tier by `python tiering.py archive`
+COLD_THRESHOLD = float(os.environ.get("MEMORIEDEN_COLD_THRESHOLD", "0.1"))
+COLD_MIN_AGE_DAYS = float(os.environ.get("MEMORIEDEN_COLD_MIN_AGE_DAYS", "30"))
+
+# How often the server writes buffered access counts
+ACCESS_FLUSH_SECONDS = float(os.environ.get("MEMORIEDEN_ACCESS_FLUSH_SECONDS", "10"))
+
+# Memories moved per transaction
+ARCHIVE_BATCH_SIZE = 500
+
+# The cold tier has a single FTS index, whatever tokenizers the hot tier uses
+COLD_FTS_TABLE = "memories_cold_fts"
+
+def create_cold_index(conn):
+    conn.execute(text(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {COLD_FTS_TABLE}
+        USING fts5(content, memory_id, tokenize='porter unicode61 remove_diacritics 2');
+    """))
+
+def decayed(importance, since, now):
+    if since is None:
+        return importance
+    age_days = max((now - since).total_seconds(), 0) / 86400
+    return importance * 0.5 ** (age_days / HALF_LIFE_DAYS)
+
+def current_importance(memory, now=None):
+    return decayed(memory.importance, memory.last_accessed_at or memory.created_at, now or datetime.utcnow())
+
+@event.listens_for(Engine, "connect")
+def register_decay(dbapi_connection, connection_record):
+    # decay(importance, age_days) in SQL, so a flush can update importance
+    # from the stored value in a single statement
+    dbapi_connection.create_function(
+        "decay", 2, lambda importance, age_days: importance * 0.5 ** (max(age_days or 0, 0) / HALF_LIFE_DAYS),
+        deterministic=True
+    )
+
+def idle_since(model, cutoff):
+    # Not edited or read since cutoff
+    return [model.updated_at < cutoff, or_(model.last_accessed_at.is_(None), model.last_accessed_at < cutoff)]
+
+# --- Access tracking ---
+
+def apply_accesses(db, counts, now):
+    # counts: memory pk -> reads since the last flush. Each memory is updated
+    # from its stored values in one statement, so flushes from several
+    # processes add up. Memories archived or deleted meanwhile are skipped.
+    result = db.execute(text("""
+        UPDATE memories
+        SET access_count = access_count + :reads,
+            importance = decay(importance, julianday(:now) - julianday(COALESCE(last_accessed_at, created_at))) + :reads,
+            last_accessed_at = :now
+        WHERE id = :id
+    """).bindparams(bindparam("now", type_=DateTime)), [
+        {"id": pk, "reads": reads, "now": now} for pk, reads in counts.items()
+    ])
+    db.commit()
+    return result.rowcount
+
+class AccessTracker:
+    # Counts reads in memory and writes them with one batched UPDATE per
+    # shard every ACCESS_FLUSH_SECONDS, so searches never write to the store.
+    # Counts of a process that dies before a flush are lost, which only makes
+    # memories look a little colder.
+
+    def __init__(self, interval=ACCESS_FLUSH_SECONDS):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = collections.defaultdict(collections.Counter)  # shard -> Counter of memory pks
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def record(self, shard, memory_pks):
+        if not memory_pks:
+            return
+        with self.lock:
+            self.pending[shard].update(memory_pks)
+            if self.thread is None:
+                # Started on first use so importing the app starts no threads
+                self.thread = threading.Thread(target=self._flush_loop, name="memorieden-access", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, collections.defaultdict(collections.Counter)
+        now = datetime.utcnow()
+        for shard, counts in pending.items():
+            db = shard.SessionLocal()
+            try:
+                apply_accesses(db, counts, now)
+            except Exception as e:
+                # Typically "database is locked"; keep the counts for the next flush
+                logger.warning(f"Could not flush access counts for shard {shard.index}: {e}")
+                db.rollback()
+                with self.lock:
+                    self.pending[shard].update(counts)
+            finally:
+                db.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+tracker = AccessTracker()
+
+# --- Moving between tiers ---
+
+def _in_pks(sql):
+    return text(sql).bindparams(bindparam("pks", expanding=True))
+
+def move_to_archive(db, pks, now, cutoff=None):
+    # Moves memories (by pk), their history and search rows to the cold tier
+    # in one transaction; returns how many moved. With cutoff, memories edited
+    # or read since then stay hot: the first statement re-checks that and
+    # takes the write lock, so they cannot change before the move commits.
+    query = select(
+        Memory.memory_id, Memory.user_id, Memory.content, Memory.meta, Memory.created_at, Memory.updated_at,
+        Memory.access_count, Memory.last_accessed_at, Memory.importance, literal(now, DateTime)
+    ).where(Memory.id.in_(pks))
+    if cutoff is not None:
+        query = query.where(*idle_since(Memory, cutoff))
+    result = db.execute(insert(ArchivedMemory).from_select([
+        "memory_id", "user_id", "content", "meta", "created_at", "updated_at",
+        "access_count", "last_accessed_at", "importance", "archived_at"
+    ], query))
+    if result.rowcount < len(pks):
+        pks = [pk for (pk,) in db.execute(_in_pks("""
+            SELECT m.id FROM memories m JOIN memories_archive a ON a.memory_id = m.memory_id WHERE m.id IN :pks
+        """), {"pks": pks})]
+        if not pks:
+            db.rollback()
+            return 0
+
+    changes = (
+        db.query(Memory.memory_id, User.user_id)
+        .outerjoin(User, Memory.user_id == User.id)
+        .filter(Memory.id.in_(pks))
+        .all()
+    )
+    db.execute(_in_pks("""
+        INSERT INTO history_archive (memory_id, prev_value, new_value, updated_at)
+        SELECT a.id, h.prev_value, h.new_value, h.updated_at
+        FROM history h
+        JOIN memories m ON m.id = h.memory_id
+        JOIN memories_archive a ON a.memory_id = m.memory_id
+        WHERE h.memory_id IN :pks
+        ORDER BY h.id
+    """), {"pks": pks})
+    db.execute(_in_pks(f"""
+        INSERT INTO {COLD_FTS_TABLE} (content, memory_id)
+        SELECT content, memory_id FROM memories WHERE id IN :pks
+    """), {"pks": pks})
+
+    fts.delete_memories(db, pks)
+    db.query(History).filter(History.memory_id.in_(pks)).delete(synchronize_session=False)
+    # Near-duplicate signatures cascade with the memory
+    db.query(Memory).filter(Memory.id.in_(pks)).delete(synchronize_session=False)
+    record_changes(db, "archive", changes)
+    db.commit()
+    return len(changes)
+
+def archive(db, threshold=COLD_THRESHOLD, min_age_days=COLD_MIN_AGE_DAYS, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    # Scans the hot tier by pk and archives memories that have gone cold;
+    # returns how many were (or, with dry_run, would be) moved
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=min_age_days)
+    moved = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(Memory.id, Memory.importance, Memory.last_accessed_at, Memory.created_at)
+            .filter(Memory.id > last_id, *idle_since(Memory, cutoff))
+            .order_by(Memory.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return moved
+        last_id = rows[-1].id
+        cold = [row.id for row in rows if decayed(row.importance, row.last_accessed_at or row.created_at, now) < threshold]
+        if cold and dry_run:
+            moved += len(cold)
+        elif cold:
+            # A memory read or edited since this scan is skipped by the move
+            moved += move_to_archive(db, cold, now, cutoff)
+
+def restore(db, archived):
+    # Moves one memory back to the hot tier and counts the restore as a read;
+    # returns the new Memory. The caller commits.
+    now = datetime.utcnow()
+    memory = Memory(
+        memory_id=archived.memory_id,
+        user_id=archived.user_id,
+        content=archived.content,
+        meta=archived.meta,
+        created_at=archived.created_at,
+        updated_at=archived.updated_at,
+        access_count=archived.access_count + 1,
+        last_accessed_at=now,
+        importance=decayed(archived.importance, archived.last_accessed_at or archived.created_at, now) + 1
+    )
+    db.add(memory)
+    db.flush()
+
+    history = db.query(ArchivedHistory).filter(ArchivedHistory.memory_id == archived.id).order_by(ArchivedHistory.id).all()
+    db.add_all([
+        History(memory_id=memory.id, prev_value=h.prev_value, new_value=h.new_value, updated_at=h.updated_at)
+        for h in history
+    ])
+    fts.insert_rows(db, [{"content": memory.content, "memory_id": memory.memory_id}])
+
+    user_id = archived.user.user_id if archived.user else None
+    delete_archived(db, archived)
+    record_change(db, "restore", memory.memory_id, user_id)
+    return memory
+
+def index_archive_range(db, first_id, last_id):
+    # Cold index rows for archived memories inserted directly, e.g. by an import
+    db.execute(text(f"""
+        INSERT INTO {COLD_FTS_TABLE} (content, memory_id)
+        SELECT content, memory_id FROM memories_archive WHERE id BETWEEN :first_id AND :last_id
+    """), {"first_id": first_id, "last_id": last_id})
+
+def delete_archived(db, archived):
+    # The caller commits
+    db.execute(text(f"DELETE FROM {COLD_FTS_TABLE} WHERE memory_id = :memory_id"), {"memory_id": archived.memory_id})
+    db.query(ArchivedHistory).filter(ArchivedHistory.memory_id == archived.id).delete(synchronize_session=False)
+    db.delete(archived)
+
+def delete_user_archive(db, user_pks):
+    # Cold-tier counterpart of fts.delete_user_memories, for rebalancing; the caller commits
+    db.execute(_in_pks(f"""
+        DELETE FROM {COLD_FTS_TABLE} WHERE memory_id IN (
+            SELECT memory_id FROM memories_archive WHERE user_id IN :pks
+        )
+    """), {"pks": list(user_pks)})
+    archived_pks = db.query(ArchivedMemory.id).filter(ArchivedMemory.user_id.in_(user_pks))
+    db.query(ArchivedHistory).filter(ArchivedHistory.memory_id.in_(archived_pks.scalar_subquery())).delete(synchronize_session=False)
+    db.query(ArchivedMemory).filter(ArchivedMemory.user_id.in_(user_pks)).delete(synchronize_session=False)
+
+def search_cold(db, match_query, user=None):
+    # ArchivedMemory rows matching an FTS MATCH expression
+    memory_ids = [row[0] for row in db.execute(
+        text(f"SELECT memory_id FROM {COLD_FTS_TABLE} WHERE content MATCH :query"), {"query": match_query}
+    )]
+    if not memory_ids:
+        return []
+    query = db.query(ArchivedMemory).filter(ArchivedMemory.memory_id.in_(memory_ids))
+    if user:
+        query = query.filter(ArchivedMemory.user_id == user.id)
+    return query.all()
+
+def main(argv=None):
+    from database import shards
+    from initialize_db import check_schema
+
+    parser = argparse.ArgumentParser(description="Move cold memories between the hot and cold tiers.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = subparsers.add_parser("archive", help="Archive memories that have gone cold")
+    archive_parser.add_argument("--threshold", type=float, default=COLD_THRESHOLD, help="Importance below which memories are cold")
+    archive_parser.add_argument("--min-age-days", type=float, default=COLD_MIN_AGE_DAYS, help="Only archive memories idle this long")
+    archive_parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    archive_parser.add_argument("--dry-run", action="store_true", help="Only report how many memories would move")
+    archive_parser.add_argument("--every", type=float, help="Keep running, archiving every this many seconds")
+
+    restore_parser = subparsers.add_parser("restore", help="Move archived memories back to the hot tier")
+    restore_parser.add_argument("memory_ids", nargs="+")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    for shard in shards:
+        check_schema(shard.engine)
+
+    if args.command == "restore":
+        remaining = set(args.memory_ids)
+        for shard in shards:
+            db = shard.SessionLocal()
+            try:
+                for archived in db.query(ArchivedMemory).filter(ArchivedMemory.memory_id.in_(remaining)).all():
+                    restore(db, archived)
+                    remaining.discard(archived.memory_id)
+                db.commit()
+            finally:
+                db.close()
+        for memory_id in sorted(remaining):
+            logger.warning(f"{memory_id} is not in the cold tier.")
+        return
+
+    while True:
+        for shard in shards:
+            db = shard.SessionLocal()
+            try:
+                moved = archive(db, args.threshold, args.min_age_days, args.batch_size, args.dry_run)
+                logger.info(f"Shard {shard.index}: {'would archive' if args.dry_run else 'archived'} {moved} memories.")
+            finally:
+                db.close()
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+# transfer.py
+from database import shards, shard_for, shard_index
+from models import User, Memory, History, ArchivedMemory, ArchivedHistory
+import fts
+import tiering
+from sqlalchemy import DateTime, bindparam, exists, insert, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime
+import argparse
+import collections
+import gzip
+import io
+import json
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Export format: NDJSON records split into chunks, each chunk compressed as its
+# own gzip member. Concatenated members form a valid gzip file, so the whole
+# export can be read back with any gzip reader, while the writer never holds
+# more than one chunk in memory.
+FORMAT_NAME = "memorieden-export"
+FORMAT_VERSION = 1
+
+EXPORT_BATCH_SIZE = 1000   # Rows fetched per keyset page
+CHUNK_RECORDS = 5000       # Records per gzip member
+IMPORT_BATCH_SIZE = 5000   # Rows per import transaction
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+# --- Export ---
+
+def export_records(dbs, user_id=None, batch_size=EXPORT_BATCH_SIZE):
+    # Yields the export of one or more shard sessions, framed by header and end records
+    yield {"type": "header", "format": FORMAT_NAME, "version": FORMAT_VERSION,
+           "exported_at": datetime.utcnow().isoformat(), "user_id": user_id}
+
+    counts = {"user": 0, "memory": 0, "history": 0}
+    for db in dbs:
+        yield from shard_records(db, counts, user_id=user_id, batch_size=batch_size)
+
+    yield {"type": "end", "counts": counts}
+
+def export_store(user_id=None, batch_size=EXPORT_BATCH_SIZE):
+    # Exports every shard, or only the shard holding user_id
+    targets = [shard_for(user_id)] if user_id else shards
+    dbs = [shard.SessionLocal() for shard in targets]
+    try:
+        yield from export_records(dbs, user_id=user_id, batch_size=batch_size)
+    finally:
+        for db in dbs:
+            db.close()
+
+def shard_records(db, counts, user_id=None, batch_size=EXPORT_BATCH_SIZE):
+    # Yields one shard's records, paging with keyset queries so memory use stays flat
+    users_query = db.query(User)
+    if user_id:
+        users_query = users_query.filter(User.user_id == user_id)
+    last_id = 0
+    while True:
+        users = users_query.filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+        if not users:
+            break
+        for user in users:
+            counts["user"] += 1
+            record = {"type": "user", "user_id": user.user_id, "metadata": user.meta, "created_at": _iso(user.created_at)}
+            if user.tokenizer:
+                record["tokenizer"] = user.tokenizer
+            yield record
+        last_id = users[-1].id
+        db.expunge_all()
+
+    yield from memory_records(db, counts, Memory, History, user_id, batch_size)
+    # Cold memories are marked with their tier, so imports keep them archived
+    yield from memory_records(db, counts, ArchivedMemory, ArchivedHistory, user_id, batch_size)
+
+def memory_records(db, counts, model, history_model, user_id=None, batch_size=EXPORT_BATCH_SIZE):
+    cold = model is ArchivedMemory
+    columns = [model.id, model.memory_id, User.user_id, model.content, model.meta, model.created_at, model.updated_at,
+               model.access_count, model.last_accessed_at, model.importance]
+    if cold:
+        columns.append(model.archived_at)
+    memories_query = db.query(*columns).outerjoin(User, model.user_id == User.id)
+    if user_id:
+        memories_query = memories_query.filter(User.user_id == user_id)
+    last_id = 0
+    while True:
+        memories = memories_query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+        if not memories:
+            break
+        for mem in memories:
+            counts["memory"] += 1
+            record = {"type": "memory", "memory_id": mem.memory_id, "user": mem.user_id, "content": mem.content,
+                      "metadata": mem.meta, "created_at": _iso(mem.created_at), "updated_at": _iso(mem.updated_at),
+                      "access_count": mem.access_count, "last_accessed_at": _iso(mem.last_accessed_at),
+                      "importance": mem.importance}
+            if cold:
+                record.update(tier="cold", archived_at=_iso(mem.archived_at))
+            yield record
+
+        # History for this page follows its memories, so import can resolve ids
+        external_ids = {mem.id: mem.memory_id for mem in memories}
+        history = (
+            db.query(history_model.memory_id, history_model.prev_value, history_model.new_value, history_model.updated_at)
+            .filter(history_model.memory_id.in_(external_ids.keys()))
+            .order_by(history_model.id)
+            .all()
+        )
+        for record in history:
+            counts["history"] += 1
+            yield {"type": "history", "memory_id": external_ids[record.memory_id], "prev_value": record.prev_value,
+                   "new_value": record.new_value, "updated_at": _iso(record.updated_at)}
+        last_id = memories[-1].id
+
+def export_chunks(records, chunk_records=CHUNK_RECORDS, compresslevel=6):
+    # Yields gzip members of up to chunk_records NDJSON lines each
+    buffer = io.BytesIO()
+    writer = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=compresslevel)
+    pending = 0
+    for record in records:
+        writer.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        pending += 1
+        if pending >= chunk_records:
+            writer.close()
+            yield buffer.getvalue()
+            buffer = io.BytesIO()
+            writer = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=compresslevel)
+            pending = 0
+    writer.close()
+    if pending:
+        yield buffer.getvalue()
+
+# --- Import ---
+
+class Importer:
+    # Buffers records and writes them with executemany in batched transactions.
+    # Each batch's FTS rows and change log entries are written with set-based
+    # INSERT ... SELECT statements in the same transaction as its memories, so
+    # a stream that fails partway leaves no unindexed or unpublished rows.
+    #
+    # Each batch holds the SQLite write lock for its whole transaction, so the
+    # rows it inserts get a contiguous id range. Only that range is indexed,
+    # which keeps concurrent writes by the server out of the statements.
+    #
+    # Memories that already exist are skipped, and history records are only
+    # added where an identical one is missing, so running an interrupted
+    # import again completes it.
+
+    def __init__(self, db, batch_size=IMPORT_BATCH_SIZE, record_changes=True):
+        self.db = db
+        self.batch_size = batch_size
+        self.record_changes = record_changes
+        self.user_ids = {}
+        self.memories = []
+        self.cold_memories = []
+        self.history = []
+        self.counts = {"user": 0, "memory": 0, "history": 0, "skipped": 0}
+
+    def _user_pk(self, user_id, meta=None, created_at=None, tokenizer=None):
+        if user_id is None:
+            return None
+        if user_id not in self.user_ids:
+            user = self.db.query(User.id).filter(User.user_id == user_id).scalar()
+            if user is None:
+                result = self.db.execute(insert(User).values(user_id=user_id, meta=meta, tokenizer=tokenizer,
+                                                             created_at=created_at or datetime.utcnow()))
+                user = result.inserted_primary_key[0]
+                self.counts["user"] += 1
+            self.user_ids[user_id] = user
+        return self.user_ids[user_id]
+
+    def add(self, record):
+        kind = record.get("type")
+        if kind == "user":
+            self._user_pk(record["user_id"], record.get("metadata"), _parse_time(record.get("created_at")),
+                          record.get("tokenizer"))
+        elif kind == "memory":
+            _require(record, "memory_id", "content")
+            row = {
+                "memory_id": record["memory_id"],
+                "user_id": self._user_pk(record.get("user")),
+                "content": record["content"],
+                "meta": record.get("metadata"),
+                "created_at": _parse_time(record.get("created_at")) or datetime.utcnow(),
+                "updated_at": _parse_time(record.get("updated_at")) or datetime.utcnow(),
+                "access_count": record.get("access_count") or 0,
+                "last_accessed_at": _parse_time(record.get("last_accessed_at")),
+                "importance": record["importance"] if record.get("importance") is not None else 1.0,
+            }
+            if record.get("tier") == "cold":
+                row["archived_at"] = _parse_time(record.get("archived_at")) or datetime.utcnow()
+                self.cold_memories.append(row)
+            else:
+                self.memories.append(row)
+        elif kind == "history":
+            _require(record, "memory_id", "prev_value", "new_value")
+            self.history.append(record)
+        elif kind == "header":
+            check_header(record)
+        elif kind != "end":
+            raise ValueError(f"Unknown record type: {kind}")
+
+        if len(self.memories) + len(self.cold_memories) + len(self.history) >= self.batch_size:
+            self.flush()
+
+    def _insert(self, model, other_model, memories):
+        # Memories already present (same memory_id), in either tier, are left
+        # untouched; returns the id range inserted into model's table, if any
+        existing = {
+            memory_id for (memory_id,) in self.db.query(other_model.memory_id)
+            .filter(other_model.memory_id.in_([mem["memory_id"] for mem in memories]))
+        }
+        rows = [mem for mem in memories if mem["memory_id"] not in existing]
+        inserted = 0
+        if rows:
+            statement = sqlite_insert(model.__table__).on_conflict_do_nothing(index_elements=["memory_id"])
+            inserted = self.db.execute(statement, rows).rowcount
+        self.counts["memory"] += inserted
+        self.counts["skipped"] += len(memories) - inserted
+        if inserted <= 0:
+            return None
+        last_id = self.db.execute(text("SELECT last_insert_rowid()")).scalar()
+        return (last_id - inserted + 1, last_id)
+
+    def flush(self):
+        if self.memories:
+            id_range = self._insert(Memory, ArchivedMemory, self.memories)
+            if id_range:
+                fts.insert_ranges(self.db, [id_range])
+                self._log(Memory, id_range)
+            self.memories = []
+
+        if self.cold_memories:
+            id_range = self._insert(ArchivedMemory, Memory, self.cold_memories)
+            if id_range:
+                tiering.index_archive_range(self.db, *id_range)
+                self._log(ArchivedMemory, id_range)
+            self.cold_memories = []
+
+        if self.history:
+            rows = [
+                {
+                    "external_id": record["memory_id"],
+                    "prev_value": record["prev_value"],
+                    "new_value": record["new_value"],
+                    "updated_at": _parse_time(record.get("updated_at")) or datetime.utcnow(),
+                }
+                for record in self.history
+            ]
+            # Each record matches its memory in at most one tier
+            for model, history_model in ((Memory, History), (ArchivedMemory, ArchivedHistory)):
+                self.counts["history"] += self.db.execute(_history_insert(model, history_model), rows).rowcount
+            self.history = []
+
+        self.db.commit()
+
+    def _log(self, model, id_range):
+        # Change log entries for one batch, before it commits
+        if not self.record_changes:
+            return
+        first, last = id_range
+        self.db.execute(text(f"""
+            INSERT INTO change_log (op, memory_id, user_id, changed_at)
+            SELECT 'add', m.memory_id, u.user_id, :now
+            FROM {model.__tablename__} m LEFT JOIN users u ON u.id = m.user_id
+            WHERE m.id BETWEEN :first_id AND :last_id
+            ORDER BY m.id
+        """), {"first_id": first, "last_id": last, "now": datetime.utcnow()})
+
+    def finish(self):
+        self.flush()
+        return self.counts
+
+def _require(record, *fields):
+    for field in fields:
+        if not isinstance(record.get(field), str):
+            raise ValueError(f"{record['type']} record needs a string {field}")
+
+def _history_insert(model, history_model):
+    # Adds a history record to the memory with its memory_id, unless that
+    # memory already has an identical record (from an earlier run)
+    prev_value = bindparam("prev_value")
+    new_value = bindparam("new_value")
+    updated_at = bindparam("updated_at", type_=DateTime)
+    duplicate = exists().where(
+        history_model.memory_id == model.id,
+        history_model.updated_at == updated_at,
+        history_model.prev_value == prev_value,
+        history_model.new_value == new_value,
+    )
+    return insert(history_model.__table__).from_select(
+        ["memory_id", "prev_value", "new_value", "updated_at"],
+        select(model.id, prev_value, new_value, updated_at)
+        .where(model.memory_id == bindparam("external_id"), ~duplicate),
+    )
+
+def check_header(record):
+    if record.get("format") != FORMAT_NAME or record.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"Unsupported export format: {record.get('format')} v{record.get('version')}")
+
+# Recently imported memory ids remembered to route their history records
+RECENT_MEMORY_IDS = 100000
+
+class ShardedImporter:
+    # Routes records to one Importer per shard by user. History records carry
+    # only a memory_id; they follow their memory closely in an export, so a
+    # bounded map of recent memory ids resolves almost all of them without a
+    # lookup, keeping memory use independent of the store size.
+
+    def __init__(self, dbs, batch_size=IMPORT_BATCH_SIZE, record_changes=True):
+        self.importers = [Importer(db, batch_size=batch_size, record_changes=record_changes) for db in dbs]
+        self.memory_shards = collections.OrderedDict()
+
+    def _history_shard(self, memory_id):
+        if memory_id in self.memory_shards:
+            return self.memory_shards[memory_id]
+        for index, importer in enumerate(self.importers):
+            for model in (Memory, ArchivedMemory):
+                if importer.db.query(model.id).filter(model.memory_id == memory_id).first():
+                    return index
+        return None
+
+    def add(self, record):
+        kind = record.get("type")
+        if kind == "user":
+            index = shard_index(record["user_id"])
+        elif kind == "memory":
+            index = shard_index(record.get("user"))
+            self.memory_shards[record["memory_id"]] = index
+            if len(self.memory_shards) > RECENT_MEMORY_IDS:
+                self.memory_shards.popitem(last=False)
+        elif kind == "history":
+            index = self._history_shard(record["memory_id"])
+            if index is None:
+                return
+        elif kind == "header":
+            check_header(record)
+            return
+        elif kind == "end":
+            return
+        else:
+            raise ValueError(f"Unknown record type: {kind}")
+        self.importers[index].add(record)
+
+    def finish(self):
+        counts = collections.Counter()
+        for importer in self.importers:
+            counts.update(importer.finish())
+        return dict(counts)
+
+def import_stream(fileobj, batch_size=IMPORT_BATCH_SIZE):
+    # fileobj: binary stream of (concatenated) gzip members
+    dbs = [shard.SessionLocal() for shard in shards]
+    try:
+        importer = ShardedImporter(dbs, batch_size=batch_size)
+        try:
+            with gzip.GzipFile(fileobj=fileobj, mode="rb") as reader:
+                for line in reader:
+                    if line.strip():
+                        importer.add(json.loads(line))
+        except Exception:
+            for db in dbs:
+                db.rollback()
+            raise
+        counts = importer.finish()
+    finally:
+        for db in dbs:
+            db.close()
+    logger.info(f"Import finished: {counts}")
+    return counts
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import a MemorieDen store as chunked gzip NDJSON.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Stream the store to a file or stdout")
+    export_parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    export_parser.add_argument("--user-id", help="Only export this user's memories")
+    export_parser.add_argument("--chunk-records", type=int, default=CHUNK_RECORDS)
+
+    import_parser = subparsers.add_parser("import", help="Load an export into the store")
+    import_parser.add_argument("input", help="Export file, or - for stdin")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    from initialize_db import check_schema
+    for shard in shards:
+        check_schema(shard.engine)
+
+    if args.command == "export":
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            for chunk in export_chunks(export_store(user_id=args.user_id), args.chunk_records):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+    else:
+        src = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+        try:
+            import_stream(src, batch_size=args.batch_size)
+        finally:
+            if src is not sys.stdin.buffer:
+                src.close()
+
+if __name__ == "__main__":
+    main()
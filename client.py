@@ -2,8 +2,9 @@
 import requests
 import sys
 import json
+from memorieden_client import MemoryClient, MemorieDenError, API_URL
 
-API_URL = "http://127.0.0.1:5000"
+client = MemoryClient(API_URL)
 
 def add_memory():
     print("\n--- Add Memory ---")
@@ -24,19 +25,11 @@ def add_memory():
     else:
         metadata = None
 
-    payload = {
-        "content": content,
-        "user_id": user_id,
-        "metadata": metadata
-    }
-
     try:
-        response = requests.post(f"{API_URL}/memories/add", json=payload)
-        if response.status_code == 201:
-            data = response.json()
-            print(f"Memory added successfully! Memory ID: {data['memory_id']}")
-        else:
-            print(f"Failed to add memory. Status Code: {response.status_code}, Message: {response.text}")
+        memory_id = client.add_memory(content, user_id=user_id, metadata=metadata)
+        print(f"Memory added successfully! Memory ID: {memory_id}")
+    except MemorieDenError as e:
+        print(f"Failed to add memory. Status Code: {e.status_code}, Message: {e.message}")
     except requests.exceptions.ConnectionError:
         print("Failed to connect to the API. Ensure the Flask server is running.")
 
@@ -52,18 +45,11 @@ def update_memory():
         print("New content cannot be empty.")
         return
 
-    payload = {
-        "memory_id": memory_id,
-        "new_content": new_content
-    }
-
     try:
-        response = requests.put(f"{API_URL}/memories/update", json=payload)
-        if response.status_code == 200:
-            data = response.json()
-            print(f"Memory '{data['memory_id']}' updated successfully!")
-        else:
-            print(f"Failed to update memory. Status Code: {response.status_code}, Message: {response.text}")
+        memory_id = client.update_memory(memory_id, new_content)
+        print(f"Memory '{memory_id}' updated successfully!")
+    except MemorieDenError as e:
+        print(f"Failed to update memory. Status Code: {e.status_code}, Message: {e.message}")
     except requests.exceptions.ConnectionError:
         print("Failed to connect to the API. Ensure the Flask server is running.")
 
@@ -76,27 +62,20 @@ def search_memories():
 
     user_id = input("Enter user ID to filter (optional): ").strip() or None
 
-    params = {"query": query}
-    if user_id:
-        params["user_id"] = user_id
-
     try:
-        response = requests.get(f"{API_URL}/memories/search", params=params)
-        if response.status_code == 200:
-            data = response.json()
-            memories = data.get("memories", [])
-            if not memories:
-                print("No memories found matching the query.")
-            else:
-                print(f"Found {len(memories)} memory/memories:")
-                for mem in memories:
-                    print(f"\nMemory ID: {mem['memory_id']}")
-                    print(f"User: {mem['user']}")
-                    print(f"Content: {mem['content']}")
-                    print(f"Metadata: {json.dumps(mem['metadata']) if mem['metadata'] else 'None'}")
-                    print(f"Relevance Score: {mem['score']}")
+        memories = client.search_memories(query, user_id=user_id)
+        if not memories:
+            print("No memories found matching the query.")
         else:
-            print(f"Failed to search memories. Status Code: {response.status_code}, Message: {response.text}")
+            print(f"Found {len(memories)} memory/memories:")
+            for mem in memories:
+                print(f"\nMemory ID: {mem['memory_id']}")
+                print(f"User: {mem['user']}")
+                print(f"Content: {mem['content']}")
+                print(f"Metadata: {json.dumps(mem['metadata']) if mem['metadata'] else 'None'}")
+                print(f"Relevance Score: {mem['score']}")
+    except MemorieDenError as e:
+        print(f"Failed to search memories. Status Code: {e.status_code}, Message: {e.message}")
     except requests.exceptions.ConnectionError:
         print("Failed to connect to the API. Ensure the Flask server is running.")
 
@@ -104,27 +83,20 @@ def get_all_memories():
     print("\n--- Get All Memories ---")
     user_id = input("Enter user ID to filter (optional): ").strip() or None
 
-    params = {}
-    if user_id:
-        params["user_id"] = user_id
-
     try:
-        response = requests.get(f"{API_URL}/memories/all", params=params)
-        if response.status_code == 200:
-            data = response.json()
-            memories = data.get("memories", [])
-            if not memories:
-                print("No memories found with the specified filters.")
-            else:
-                print(f"Retrieved {len(memories)} memory/memories:")
-                for mem in memories:
-                    print(f"\nMemory ID: {mem['memory_id']}")
-                    print(f"Content: {mem['content']}")
-                    print(f"Metadata: {json.dumps(mem['metadata']) if mem['metadata'] else 'None'}")
-                    print(f"Created At: {mem['created_at']}")
-                    print(f"Updated At: {mem['updated_at']}")
+        memories = client.get_all_memories(user_id=user_id)
+        if not memories:
+            print("No memories found with the specified filters.")
         else:
-            print(f"Failed to retrieve memories. Status Code: {response.status_code}, Message: {response.text}")
+            print(f"Retrieved {len(memories)} memory/memories:")
+            for mem in memories:
+                print(f"\nMemory ID: {mem['memory_id']}")
+                print(f"Content: {mem['content']}")
+                print(f"Metadata: {json.dumps(mem['metadata']) if mem['metadata'] else 'None'}")
+                print(f"Created At: {mem['created_at']}")
+                print(f"Updated At: {mem['updated_at']}")
+    except MemorieDenError as e:
+        print(f"Failed to retrieve memories. Status Code: {e.status_code}, Message: {e.message}")
     except requests.exceptions.ConnectionError:
         print("Failed to connect to the API. Ensure the Flask server is running.")
 
@@ -136,20 +108,17 @@ def get_memory_history():
         return
 
     try:
-        response = requests.get(f"{API_URL}/memories/history/{memory_id}")
-        if response.status_code == 200:
-            data = response.json()
-            history = data.get("history", [])
-            if not history:
-                print("No history found for the specified Memory ID.")
-            else:
-                print(f"History for Memory ID '{memory_id}':")
-                for record in history:
-                    print(f"\nPrevious Value: {record['prev_value']}")
-                    print(f"New Value: {record['new_value']}")
-                    print(f"Updated At: {record['updated_at']}")
+        history = client.get_memory_history(memory_id)
+        if not history:
+            print("No history found for the specified Memory ID.")
         else:
-            print(f"Failed to retrieve history. Status Code: {response.status_code}, Message: {response.text}")
+            print(f"History for Memory ID '{memory_id}':")
+            for record in history:
+                print(f"\nPrevious Value: {record['prev_value']}")
+                print(f"New Value: {record['new_value']}")
+                print(f"Updated At: {record['updated_at']}")
+    except MemorieDenError as e:
+        print(f"Failed to retrieve history. Status Code: {e.status_code}, Message: {e.message}")
     except requests.exceptions.ConnectionError:
         print("Failed to connect to the API. Ensure the Flask server is running.")
 
@@ -172,18 +141,11 @@ def add_user():
     else:
         metadata = None
 
-    payload = {
-        "user_id": user_id,
-        "metadata": metadata
-    }
-
     try:
-        response = requests.post(f"{API_URL}/users/add", json=payload)
-        if response.status_code == 201:
-            data = response.json()
-            print(f"User '{data['user_id']}' added successfully!")
-        else:
-            print(f"Failed to add user. Status Code: {response.status_code}, Message: {response.text}")
+        user_id = client.add_user(user_id, metadata=metadata)
+        print(f"User '{user_id}' added successfully!")
+    except MemorieDenError as e:
+        print(f"Failed to add user. Status Code: {e.status_code}, Message: {e.message}")
     except requests.exceptions.ConnectionError:
         print("Failed to connect to the API. Ensure the Flask server is running.")
 
@@ -194,23 +156,18 @@ def search_users():
         print("User ID cannot be empty.")
         return
 
-    params = {"user_id": user_id}
-
     try:
-        response = requests.get(f"{API_URL}/users/search", params=params)
-        if response.status_code == 200:
-            data = response.json()
-            users = data.get("users", [])
-            if not users:
-                print("No users found matching the search criteria.")
-            else:
-                print(f"Found {len(users)} user(s):")
-                for user in users:
-                    print(f"\nUser ID: {user['user_id']}")
-                    print(f"Metadata: {json.dumps(user['metadata']) if user['metadata'] else 'None'}")
-                    print(f"Created At: {user['created_at']}")
+        users = client.search_users(user_id)
+        if not users:
+            print("No users found matching the search criteria.")
         else:
-            print(f"Failed to search users. Status Code: {response.status_code}, Message: {response.text}")
+            print(f"Found {len(users)} user(s):")
+            for user in users:
+                print(f"\nUser ID: {user['user_id']}")
+                print(f"Metadata: {json.dumps(user['metadata']) if user['metadata'] else 'None'}")
+                print(f"Created At: {user['created_at']}")
+    except MemorieDenError as e:
+        print(f"Failed to search users. Status Code: {e.status_code}, Message: {e.message}")
     except requests.exceptions.ConnectionError:
         print("Failed to connect to the API. Ensure the Flask server is running.")
 
@@ -218,25 +175,23 @@ def list_all_users():
     print("\n--- List All Users ---")
 
     try:
-        response = requests.get(f"{API_URL}/users/all")
-        if response.status_code == 200:
-            data = response.json()
-            users = data.get("users", [])
-            if not users:
-                print("No users found.")
-            else:
-                print(f"Total Users: {len(users)}")
-                for user in users:
-                    print(f"\nUser ID: {user['user_id']}")
-                    print(f"Metadata: {json.dumps(user['metadata']) if user['metadata'] else 'None'}")
-                    print(f"Created At: {user['created_at']}")
+        users = client.list_users()
+        if not users:
+            print("No users found.")
         else:
-            print(f"Failed to retrieve users. Status Code: {response.status_code}, Message: {response.text}")
+            print(f"Total Users: {len(users)}")
+            for user in users:
+                print(f"\nUser ID: {user['user_id']}")
+                print(f"Metadata: {json.dumps(user['metadata']) if user['metadata'] else 'None'}")
+                print(f"Created At: {user['created_at']}")
+    except MemorieDenError as e:
+        print(f"Failed to retrieve users. Status Code: {e.status_code}, Message: {e.message}")
     except requests.exceptions.ConnectionError:
         print("Failed to connect to the API. Ensure the Flask server is running.")
 
 def exit_client():
     print("\nExiting the Mem0 Text Client. Goodbye!")
+    client.close()
     sys.exit(0)
 
 def display_menu():
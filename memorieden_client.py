@@ -0,0 +1,528 @@
+# memorieden_client.py
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import asyncio
+import collections
+import functools
+import logging
+import random
+import threading
+import time
+import requests
+
+API_URL = "http://127.0.0.1:5000"
+
+logger = logging.getLogger(__name__)
+
+class MemorieDenError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+class DatabaseLockedError(MemorieDenError):
+    pass
+
+class SearchCache:
+    # Bounded LRU of search results keyed by (user_id, query).
+    #
+    # A change to user U invalidates U's entries and every unscoped (None)
+    # entry. Each lookup hands out a token; results fetched while an
+    # invalidation raced the request are not stored. The cache only serves
+    # while the change feed is connected ("live").
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.keys_by_user = collections.defaultdict(set)
+        self.generations = collections.Counter()
+        self.resets = 0
+        self.live = False
+        self.hits = 0
+        self.misses = 0
+
+    def _token(self, user_id):
+        return (self.resets, self.generations[user_id])
+
+    def lookup(self, user_id, query):
+        # Returns (results or None, token for a later store())
+        key = (user_id, query)
+        with self.lock:
+            if self.live and key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key], None
+            self.misses += 1
+            return None, self._token(user_id)
+
+    def store(self, user_id, query, results, token):
+        key = (user_id, query)
+        with self.lock:
+            if not self.live or token != self._token(user_id):
+                return
+            self.entries[key] = results
+            self.entries.move_to_end(key)
+            self.keys_by_user[user_id].add(key)
+            while len(self.entries) > self.max_entries:
+                old_key, _ = self.entries.popitem(last=False)
+                self.keys_by_user[old_key[0]].discard(old_key)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            # Unscoped searches span every user, so any change affects them
+            for scope in {user_id, None}:
+                self.generations[scope] += 1
+                for key in self.keys_by_user.pop(scope, ()):
+                    self.entries.pop(key, None)
+
+    def clear(self, live=None):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
+            self.resets += 1
+            if live is not None:
+                self.live = live
+
+class MemoryClient:
+    # Thread-safe client backed by one keep-alive connection pool.
+    #
+    # pool_size bounds both the number of pooled connections and the worker
+    # threads used for concurrent fan-out. Adds queued through queue_memory()
+    # are micro-batched into /memories/add_bulk: a batch is sent when it
+    # reaches batch_size or batch_interval seconds after its first item.
+    #
+    # With cache_size > 0, search results are cached locally and invalidated
+    # by a background thread long-polling the server's /changes feed.
+
+    def __init__(self, base_url=API_URL, pool_size=10, timeout=10.0, max_retries=5,
+                 backoff=0.05, batch_size=100, batch_interval=0.02, cache_size=0, change_poll_timeout=25.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._pending_ready = threading.Condition(self._pending_lock)
+        self._batcher = None
+        self._closed = False
+
+        self.cache = SearchCache(cache_size) if cache_size > 0 else None
+        self.change_poll_timeout = change_poll_timeout
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="memorieden")
+            return self._executor
+
+    def close(self):
+        self.flush()
+        with self._pending_lock:
+            self._closed = True
+            self._pending_ready.notify_all()
+        if self.cache is not None:
+            self.cache.clear(live=False)
+        if self._batcher is not None:
+            self._batcher.join()
+            self._batcher = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+    # --- Transport ---
+
+    def _request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            if response.ok:
+                return response.json()
+
+            try:
+                message = response.json().get("error", response.text)
+            except ValueError:
+                message = response.text
+
+            if response.status_code == 503 and "database is locked" in message:
+                if attempt >= self.max_retries:
+                    raise DatabaseLockedError(response.status_code, message)
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, self.backoff * (2 ** attempt))
+                logger.debug(f"Database locked on {method} {path}; retrying in {delay:.3f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            raise MemorieDenError(response.status_code, message)
+
+    # --- Change feed ---
+
+    def _ensure_watcher(self):
+        with self._watcher_lock:
+            if self._watcher is None and not self._closed:
+                self._watcher = threading.Thread(target=self._watch_changes, name="memorieden-changes", daemon=True)
+                self._watcher.start()
+
+    def _watch_changes(self):
+        cursor = None
+        while not self._closed:
+            params = {"since": cursor, "timeout": self.change_poll_timeout if cursor else 0}
+            try:
+                data = self._request("GET", "/changes", params=params, timeout=self.timeout + self.change_poll_timeout)
+            except Exception as e:
+                if self._closed:
+                    return
+                # Without the feed we cannot know what is stale; stop serving until reconnected
+                logger.warning(f"Change feed unavailable, cache disabled: {e}")
+                self.cache.clear(live=False)
+                cursor = None
+                time.sleep(min(self.backoff * 20, 5.0))
+                continue
+
+            if cursor is None or data["reset"]:
+                self.cache.clear(live=True)
+            for change in data["changes"]:
+                self.cache.invalidate(change["user"])
+            cursor = data["cursor"]
+
+    def get_changes(self, since=None, limit=1000, timeout=0):
+        # One page of the change log: (changes, next_cursor, reset, has_more)
+        params = {"since": since, "limit": limit, "timeout": timeout}
+        data = self._request("GET", "/changes", params=params, timeout=self.timeout + timeout)
+        return data["changes"], data["cursor"], data["reset"], data["has_more"]
+
+    def iter_changes(self, since, limit=1000):
+        # Yields every change after `since`, page by page, until caught up.
+        # Raises if the cursor is no longer valid and a full resync is needed.
+        while True:
+            changes, since, reset, has_more = self.get_changes(since, limit=limit)
+            if reset:
+                raise MemorieDenError(410, "Change cursor expired; full resync required.")
+            yield from changes
+            if not has_more:
+                return
+
+    def _invalidate(self, user_ids):
+        # Our own writes are visible to our next read without waiting for the feed
+        if self.cache is not None:
+            for user_id in set(user_ids):
+                self.cache.invalidate(user_id)
+
+    # --- Memories ---
+
+    def add_memory(self, content, user_id=None, metadata=None, dedup=None):
+        # dedup overrides the server's near-duplicate policy: off, reject, merge or tag
+        payload = {"content": content, "user_id": user_id, "metadata": metadata}
+        if dedup:
+            payload["dedup"] = dedup
+        memory_id = self._request("POST", "/memories/add", json=payload)["memory_id"]
+        self._invalidate([user_id])
+        return memory_id
+
+    def add_memories(self, memories, dedup=None):
+        # memories: iterable of dicts with content, and optionally user_id and metadata.
+        # Returns ids in input order; None for memories rejected as near-duplicates.
+        memories = list(memories)
+        memory_ids = []
+        for start in range(0, len(memories), self.batch_size):
+            chunk = memories[start:start + self.batch_size]
+            memory_ids.extend(self._add_bulk(chunk, dedup))
+            self._invalidate(item.get("user_id") for item in chunk)
+        return memory_ids
+
+    def _add_bulk(self, items, dedup=None):
+        # One /memories/add_bulk call. A batch spanning shards can come back
+        # partial (207) when a shard fails to commit after others did; only
+        # the items marked failed are resent, so none is stored twice.
+        memory_ids = [None] * len(items)
+        pending = list(range(len(items)))
+        attempt = 0
+        while True:
+            payload = {"memories": [items[i] for i in pending]}
+            if dedup:
+                payload["dedup"] = dedup
+            results = self._request("POST", "/memories/add_bulk", json=payload)["results"]
+            failed = []
+            for i, result in zip(pending, results):
+                if result["status"] == "failed":
+                    failed.append(i)
+                else:
+                    memory_ids[i] = result["memory_id"]
+            if not failed:
+                return memory_ids
+            if attempt >= self.max_retries:
+                raise DatabaseLockedError(503, f"{len(failed)} memories could not be committed.")
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+            attempt += 1
+            pending = failed
+
+    def queue_memory(self, content, user_id=None, metadata=None):
+        # Returns a Future resolving to the memory_id once its batch is written
+        future = Future()
+        item = {"content": content, "user_id": user_id, "metadata": metadata}
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError("Client is closed.")
+            self._pending.append((item, future))
+            if self._batcher is None:
+                self._batcher = threading.Thread(target=self._batch_loop, name="memorieden-batcher", daemon=True)
+                self._batcher.start()
+            self._pending_ready.notify()
+        return future
+
+    def flush(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        self._send_batch(batch)
+
+    def _batch_loop(self):
+        while True:
+            with self._pending_lock:
+                while not self._pending and not self._closed:
+                    self._pending_ready.wait()
+                if self._closed and not self._pending:
+                    return
+                deadline = time.monotonic() + self.batch_interval
+                while len(self._pending) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_ready.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                self._pending = self._pending[self.batch_size:]
+            self._send_batch(batch)
+
+    def _send_batch(self, batch):
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            try:
+                memory_ids = self._add_bulk([item for item, _ in chunk])
+            except Exception as e:
+                for _, future in chunk:
+                    future.set_exception(e)
+                continue
+            self._invalidate(item.get("user_id") for item, _ in chunk)
+            for (_, future), memory_id in zip(chunk, memory_ids):
+                future.set_result(memory_id)
+
+    def update_memory(self, memory_id, new_content):
+        payload = {"memory_id": memory_id, "new_content": new_content}
+        data = self._request("PUT", "/memories/update", json=payload)
+        self._invalidate([data.get("user")])
+        return data["memory_id"]
+
+    def delete_memory(self, memory_id):
+        data = self._request("DELETE", f"/memories/delete/{memory_id}")
+        self._invalidate([data.get("user")])
+        return data["memory_id"]
+
+    def search_memories(self, query, user_id=None, collapse=False, include_cold=False):
+        # collapse=True returns one memory per near-duplicate cluster;
+        # include_cold=True also searches archived memories
+        user_id = user_id or None
+        key = (query, collapse, include_cold)
+        token = None
+        if self.cache is not None:
+            self._ensure_watcher()
+            cached, token = self.cache.lookup(user_id, key)
+            if cached is not None:
+                return cached
+
+        params = {"query": query}
+        if user_id:
+            params["user_id"] = user_id
+        if collapse:
+            params["collapse"] = "true"
+        if include_cold:
+            params["include_cold"] = "true"
+        memories = self._request("GET", "/memories/search", params=params)["memories"]
+
+        if self.cache is not None:
+            self.cache.store(user_id, key, memories, token)
+        return memories
+
+    def search_many(self, queries):
+        # queries: iterable of query strings or (query, user_id) pairs; results keep input order
+        futures = []
+        for query in queries:
+            query, user_id = (query, None) if isinstance(query, str) else query
+            futures.append(self.executor.submit(self.search_memories, query, user_id))
+        return [future.result() for future in futures]
+
+    def get_all_memories(self, user_id=None, include_cold=False):
+        params = {"user_id": user_id} if user_id else {}
+        if include_cold:
+            params["include_cold"] = "true"
+        return self._request("GET", "/memories/all", params=params)["memories"]
+
+    def iter_memories(self, user_id=None, page_size=500, include_cold=False):
+        # Pages through /memories/all newest first without loading the whole store at once
+        params = {"limit": page_size}
+        if user_id:
+            params["user_id"] = user_id
+        if include_cold:
+            params["include_cold"] = "true"
+        while True:
+            page = self._request("GET", "/memories/all", params=params)
+            yield from page["memories"]
+            if not page["next_cursor"]:
+                return
+            params["cursor"] = page["next_cursor"]
+
+    def get_memory_history(self, memory_id):
+        return self._request("GET", f"/memories/history/{memory_id}")["history"]
+
+    # --- Users ---
+
+    def add_user(self, user_id, metadata=None, tokenizer=None):
+        # tokenizer picks the user's search index: porter, unicode61 or trigram
+        payload = {"user_id": user_id, "metadata": metadata}
+        if tokenizer:
+            payload["tokenizer"] = tokenizer
+        return self._request("POST", "/users/add", json=payload)["user_id"]
+
+    def update_user(self, user_id, **fields):
+        # fields: metadata and/or tokenizer (None reverts to the server default)
+        # A new tokenizer changes the user's search results
+        data = self._request("PUT", "/users/update", json=dict(fields, user_id=user_id))
+        self._invalidate([user_id])
+        return data
+
+    def search_users(self, user_id):
+        return self._request("GET", "/users/search", params={"user_id": user_id})["users"]
+
+    def list_users(self):
+        return self._request("GET", "/users/all")["users"]
+
+    def iter_users(self, page_size=500):
+        # Pages through /users/all in user_id order
+        params = {"limit": page_size}
+        while True:
+            page = self._request("GET", "/users/all", params=params)
+            yield from page["users"]
+            if not page["next_cursor"]:
+                return
+            params["cursor"] = page["next_cursor"]
+
+class AsyncMemoryClient:
+    # asyncio front end for MemoryClient. Blocking calls run on the client's
+    # worker pool so they share its keep-alive connections; adds awaited
+    # concurrently are coalesced into bulk requests.
+
+    def __init__(self, base_url=API_URL, **kwargs):
+        self.client = MemoryClient(base_url, **kwargs)
+        self._pending = []
+        self._flush_handle = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        await self.flush()
+        # Not on the client's own pool: close() shuts that pool down
+        await asyncio.get_running_loop().run_in_executor(None, self.client.close)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.client.executor, functools.partial(func, *args, **kwargs))
+
+    async def add_memory(self, content, user_id=None, metadata=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(({"content": content, "user_id": user_id, "metadata": metadata}, future))
+        if len(self._pending) >= self.client.batch_size:
+            self._schedule_flush(0)
+        elif self._flush_handle is None:
+            self._schedule_flush(self.client.batch_interval)
+        return await future
+
+    def _schedule_flush(self, delay):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._flush_handle = loop.call_later(delay, lambda: loop.create_task(self.flush()))
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        for start in range(0, len(batch), self.client.batch_size):
+            chunk = batch[start:start + self.client.batch_size]
+            try:
+                memory_ids = await self._run(self.client.add_memories, [item for item, _ in chunk])
+            except Exception as e:
+                for _, future in chunk:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), memory_id in zip(chunk, memory_ids):
+                if not future.done():
+                    future.set_result(memory_id)
+
+    async def add_memories(self, memories, dedup=None):
+        return await self._run(self.client.add_memories, memories, dedup)
+
+    async def update_memory(self, memory_id, new_content):
+        return await self._run(self.client.update_memory, memory_id, new_content)
+
+    async def delete_memory(self, memory_id):
+        return await self._run(self.client.delete_memory, memory_id)
+
+    async def get_changes(self, since=None, limit=1000, timeout=0):
+        return await self._run(self.client.get_changes, since, limit, timeout)
+
+    async def search_memories(self, query, user_id=None, collapse=False, include_cold=False):
+        return await self._run(self.client.search_memories, query, user_id, collapse, include_cold)
+
+    async def search_many(self, queries):
+        tasks = []
+        for query in queries:
+            query, user_id = (query, None) if isinstance(query, str) else query
+            tasks.append(self.search_memories(query, user_id))
+        return await asyncio.gather(*tasks)
+
+    async def get_all_memories(self, user_id=None, include_cold=False):
+        return await self._run(self.client.get_all_memories, user_id, include_cold)
+
+    async def get_memory_history(self, memory_id):
+        return await self._run(self.client.get_memory_history, memory_id)
+
+    async def add_user(self, user_id, metadata=None, tokenizer=None):
+        return await self._run(self.client.add_user, user_id, metadata, tokenizer)
+
+    async def update_user(self, user_id, **fields):
+        return await self._run(functools.partial(self.client.update_user, user_id, **fields))
+
+    async def search_users(self, user_id):
+        return await self._run(self.client.search_users, user_id)
+
+    async def list_users(self):
+        return await self._run(self.client.list_users)